@@ -1,12 +1,17 @@
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from telegram import Update, Bot
 from telegram.ext import Application, MessageHandler as TGMessageHandler, filters, CommandHandler
 from handlers.message_handler import MessageHandler as MessageHandlerClass
 from schedulers.scheduler import init_scheduler
+from brain.notion_logger import flush_logs, notion
+from flows.workflow_run import manager as workflow_manager
+from services.metrics import render_prometheus
 
 
 
@@ -34,13 +39,14 @@ bot_app.add_handler(CommandHandler("start", handler.handle_start))
 bot_app.add_handler(CommandHandler("help", handler.handle_help))
 
 scheduler = None
+warm_task = None
 
 # -----------------------------
 # Lifespan (khởi tạo bot + graph)
 # -----------------------------
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global scheduler, graph
+    global scheduler, graph, warm_task
     logger.info("🚀 Startup...")
 
     # Telegram bot
@@ -52,6 +58,10 @@ async def lifespan(app: FastAPI):
         await bot_app.bot.set_webhook(WEBHOOK_URL)
         logger.info("🌍 Webhook set: %s", WEBHOOK_URL)
 
+    # Nạp page id Notion ở nền (1 query phân trang / data source), không chặn startup;
+    # lookup chưa có trong cache sẽ tự hỏi Notion trực tiếp
+    warm_task = asyncio.create_task(asyncio.to_thread(notion.warm))
+
     scheduler = init_scheduler()
     logger.info("🧠 Graph workflow initialized")
 
@@ -59,9 +69,12 @@ async def lifespan(app: FastAPI):
 
     # Cleanup
     logger.info("🛑 Shutdown...")
+    await asyncio.to_thread(workflow_manager.shutdown)
     if scheduler and scheduler.running:
         scheduler.shutdown(wait=False)
         logger.info("⏰ Scheduler stopped")
+    if not await asyncio.to_thread(flush_logs, 10):
+        logger.warning("⚠️ Notion status queue chưa gửi hết khi shutdown")
     await bot_app.stop()
     await bot_app.shutdown()
     logger.info("🔴 Telegram bot stopped")
@@ -79,11 +92,44 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     return {"service": "telegram-bot+workflow", "status": "running"}
 
 
+@app.post("/workflow/runs")
+async def create_workflow_run(message: str = "mở quẻ"):
+    run_id = workflow_manager.submit(message)
+    if not run_id:
+        return {"ok": False, "error": "queue full"}
+    return {"ok": True, "run_id": run_id}
+
+
+@app.get("/workflow/runs")
+async def list_workflow_runs():
+    return {"runs": workflow_manager.active()}
+
+
+@app.post("/workflow/runs/{run_id}/resume")
+async def resume_workflow_run(run_id: str):
+    if not workflow_manager.resume(run_id):
+        return {"ok": False, "error": "queue full"}
+    return {"ok": True, "run_id": run_id}
+
+
+@app.get("/workflow/runs/{run_id}")
+async def get_workflow_run(run_id: str):
+    run = workflow_manager.get(run_id)
+    if not run:
+        return {"ok": False, "error": "run not found"}
+    return {"ok": True, "run": run}
+
+
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
     try:
@@ -1,90 +1,232 @@
 # nodes.py
+import os
+import copy
+import asyncio
+import inspect
+import threading
+import traceback
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Set, Tuple
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage
 from typing_extensions import TypedDict
 
-from brain.policy import PolicyEngine
-from brain.tiny_ml import TinyML
 from brain.notion_logger import done_log, failed_log, start_log, not_started_log
 from brain.types import State
-
-# Node imports
-from nodes.content_fb_pipeline import content_and_facebook_node
-from nodes.keyword_node import keyword_node
-from nodes.research_node import research_node
-from nodes.insight_node import insight_node
-from nodes.idea_node import idea_node
-from nodes.title_node import title_node
-from nodes.content_node import content_node
-from nodes.image_node import image_node
-from nodes.seo_node import seo_node
-from nodes.publish_node import publish_node
 from nodes.finalize_node import finalize_node
-from nodes.data_analysis_node import data_analysis_node
-from nodes.create_daily_node import create_daily_node
-from nodes.human_reference_node import human_reference_node
+from services.llm_cache import bypass_cache
+from services.metrics import merge_metrics, record_node_status, record_retry, track_node
+from services.prompt_context import PROMPT_FIELDS
+from services.registry import import_string, lazy
 
 # =========================
-# Khởi tạo Brain & Policy
+# Brain & Policy (tạo lazy ở lần dùng đầu, không train TinyML lúc import)
 # =========================
-tiny_ml = TinyML()
-policy = PolicyEngine()
+tiny_ml = lazy("tiny_ml")
+policy = lazy("policy")
+
 
 # =========================
 # Map node name -> function
+# - Khai báo bằng đường dẫn import, module node chỉ được import khi node chạy lần đầu
+#   (tránh kéo PIL/moviepy/chromadb/... vào lúc khởi động)
 # =========================
-node_map = {
-    "data_analysis": data_analysis_node,
-    "create_daily": create_daily_node,
-    "human_reference": human_reference_node,
-    "keyword": keyword_node,
-    "research": research_node,
-    "insight": insight_node,
-    "idea": idea_node,
-    "title": title_node,
-    "content": content_node,
-    "image": image_node,
-    "seo": seo_node,
-    "publish": publish_node,
-    "facebook": content_and_facebook_node,
-   
-}
+class LazyNodeMap(Mapping):
+    def __init__(self, paths: Dict[str, str]):
+        self._paths = dict(paths)
+        self._loaded: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> Callable:
+        fn = self._loaded.get(name)
+        if fn is None:
+            path = self._paths[name]
+            with self._lock:
+                fn = self._loaded.get(name)
+                if fn is None:
+                    fn = self._loaded[name] = import_string(path)
+        return fn
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+
+node_map = LazyNodeMap({
+    "data_analysis": "nodes.data_analysis_node:data_analysis_node",
+    "create_daily": "nodes.create_daily_node:create_daily_node",
+    "human_reference": "nodes.human_reference_node:human_reference_node",
+    "keyword": "nodes.keyword_node:keyword_node",
+    "research": "nodes.research_node:research_node",
+    "insight": "nodes.insight_node:insight_node",
+    "idea": "nodes.idea_node:idea_node",
+    "title": "nodes.title_node:title_node",
+    "content": "nodes.content_node:content_node",
+    "image": "nodes.image_node:image_node",
+    "seo": "nodes.seo_node:seo_node",
+    "publish": "nodes.publish_node:publish_node",
+    "facebook": "nodes.content_fb_pipeline:content_and_facebook_node",
+})
 
 # =========================
-# Node 1: AI quyết định sequence
+# Khai báo key đọc/ghi của từng node (để runner dựng DAG)
+# - "daily", "topic", "outputs.<node>" ... ; "*" = toàn bộ state
+# - node không khai báo → coi như đọc/ghi "*" (chạy tuần tự như cũ)
+# - node có side effect ra ngoài (đăng bài) khai báo "*" để luôn chạy sau cùng
+# - node dựng prompt bằng build_context lấy reads từ PROMPT_FIELDS (1 khai báo dùng chung)
 # =========================
-def decide_sequence_node(state: State) -> State:
-    sequence = tiny_ml.decide_sequence(str(state))
-    state["status"]["sequence"] = sequence
-    state["status"]["step"] = 0
-    return state
+class NodeIO(NamedTuple):
+    reads: Tuple[str, ...]
+    writes: Tuple[str, ...]
+
+
+def _reads(node_name: str, *extra: str) -> Tuple[str, ...]:
+    """Field prompt của node (PROMPT_FIELDS) + key node đọc ngoài prompt."""
+    return tuple(dict.fromkeys(PROMPT_FIELDS.get(node_name, ()) + extra))
+
+
+node_io: Dict[str, NodeIO] = {
+    "data_analysis": NodeIO(reads=_reads("data_analysis"), writes=("daily",)),
+    "create_daily": NodeIO(reads=("daily",), writes=("daily",)),
+    "human_reference": NodeIO(reads=("daily",), writes=("daily",)),
+    "keyword": NodeIO(reads=("topic",), writes=("outputs.keyword",)),
+    "research": NodeIO(reads=_reads("research"), writes=("outputs.research",)),
+    "insight": NodeIO(reads=(), writes=("outputs.insight",)),
+    "idea": NodeIO(reads=(), writes=("outputs.idea",)),
+    "title": NodeIO(reads=_reads("title"), writes=("outputs.title",)),
+    "content": NodeIO(reads=_reads("content", "daily"), writes=("outputs.content",)),
+    "image": NodeIO(reads=("status.node_data",), writes=("outputs.image",)),
+    "seo": NodeIO(reads=("status.node_data", "outputs"), writes=("outputs.seo", "status.node_data.seo")),
+    "publish": NodeIO(reads=("*",), writes=("*",)),
+    "facebook": NodeIO(reads=("*",), writes=("*",)),
+}
+
+RUNNER_MAX_WORKERS = int(os.getenv("RUNNER_MAX_WORKERS", "4"))
+_executor = ThreadPoolExecutor(max_workers=max(1, RUNNER_MAX_WORKERS), thread_name_prefix="runner")
+
+
+def _overlap(a: str, b: str) -> bool:
+    return a == "*" or b == "*" or a == b or a.startswith(b + ".") or b.startswith(a + ".")
+
+
+def _conflicts(xs, ys) -> bool:
+    return any(_overlap(x, y) for x in xs for y in ys)
+
+
+def build_dag(sequence: List[str]) -> Dict[int, Set[int]]:
+    """
+    Trả về {vị trí: {các vị trí phải xong trước}} theo thứ tự sequence.
+    Node sau phụ thuộc node trước nếu đọc key node trước ghi (RAW),
+    ghi cùng key (WAW) hoặc ghi key node trước đọc (WAR).
+    """
+    default = NodeIO(reads=("*",), writes=("*",))
+    io = [node_io.get(name, default) for name in sequence]
+    deps: Dict[int, Set[int]] = {}
+    for i, cur in enumerate(io):
+        deps[i] = {
+            j for j in range(i)
+            if _conflicts(io[j].writes, cur.reads)
+            or _conflicts(io[j].writes, cur.writes)
+            or _conflicts(io[j].reads, cur.writes)
+        }
+    return deps
+
+
+def ready_nodes(sequence: List[str], finished: Dict[str, str]) -> List[str]:
+    """Các node chưa xong mà mọi node phụ thuộc đã xong (done hoặc failed/skip)."""
+    deps = build_dag(sequence)
+    return [
+        name for i, name in enumerate(sequence)
+        if name not in finished and all(sequence[j] in finished for j in deps[i])
+    ]
+
 
 # =========================
-# Node 2: Runner thực thi từng bước
+# Async node protocol: async def node(state) -> dict
+# Node sync cũ được bọc bằng asyncio.to_thread; node async dùng trực tiếp.
 # =========================
-def runner_node(state: State) -> State:
-    seq = state["status"].get("sequence", [])
-    step = state["status"].get("step", 0)
+AsyncNode = Callable[[State], Awaitable[dict]]
 
-    if step >= len(seq):
-        return state
 
-    node_name = seq[step]
+def as_async(fn: Callable) -> AsyncNode:
+    if inspect.iscoroutinefunction(fn):
+        return fn
 
-    if node_name not in state["status"].get("nodes", {}):
-        not_started_log(node_name)
+    async def _adapter(state):
+        return await asyncio.to_thread(fn, state)
 
-    if not policy.can_run(node_name):
-        state["status"]["step"] = step + 1
-        failed_log(node_name)
-        return state
+    _adapter.__name__ = getattr(fn, "__name__", "node")
+    return _adapter
+
+
+def _failed(node_name: str, e: Exception) -> dict:
+    traceback.print_exc()
+    return {"status": "failed", "messages": [HumanMessage(content=f"Node {node_name} lỗi: {e}")]}
+
+
+def _is_retry(node_name: str, state: State) -> bool:
+    # lần chạy lại của node → không đọc cache LLM (lần trước có thể fail vì response đã cache)
+    return (state.get("retries") or {}).get(node_name, 0) > 0
+
+
+def _call_node(node_name: str, state: State) -> dict:
+    """Gọi node, kèm số liệu (thời gian, LLM, HTTP, retry) ở key "_metrics"."""
+    with track_node(node_name) as m, bypass_cache(_is_retry(node_name, state)):
+        try:
+            fn = node_map[node_name]
+            if inspect.iscoroutinefunction(fn):
+                # runner sync (thread riêng, không có event loop) gọi node async
+                out = asyncio.run(fn(state))
+            else:
+                out = fn(state)
+        except Exception as e:
+            out = _failed(node_name, e)
+    return {**(out or {}), "_metrics": m}
+
+
+async def _acall_node(node_name: str, state: State) -> dict:
+    with track_node(node_name) as m, bypass_cache(_is_retry(node_name, state)):
+        try:
+            out = await as_async(node_map[node_name])(state)
+        except Exception as e:
+            out = _failed(node_name, e)
+    return {**(out or {}), "_metrics": m}
 
-    start_log(node_name)
-    policy.register_run(node_name)
+# =========================
+# Node 1: AI quyết định sequence
+# =========================
+def latest_human_message(state: State) -> str:
+    """Nội dung tin nhắn người dùng gần nhất (router chỉ cần câu lệnh, không cần cả state)."""
+    for msg in reversed(state.get("messages") or []):
+        if isinstance(msg, dict):
+            if msg.get("role") in ("user", "human") or msg.get("type") == "human":
+                return str(msg.get("content", ""))
+        elif getattr(msg, "type", None) == "human":
+            return str(msg.content)
+    return ""
+
+
+def decide_sequence_node(state: State) -> dict:
+    sequence = tiny_ml.decide_sequence(latest_human_message(state))
+    return {"status": {**(state.get("status") or {}), "sequence": sequence, "step": 0}}
 
-    out = node_map[node_name](state)
+# =========================
+# Node 2: Runner thực thi các node sẵn sàng (song song theo DAG)
+# =========================
+def _apply_result(state: State, node_name: str, out: dict):
+    """Merge kết quả 1 node vào state (gọi tuần tự theo thứ tự sequence)."""
+    finished = state["status"].setdefault("nodes", {})
     status = out.get("status", "failed")
 
+    # Cộng dồn số liệu node vào state (finalize_node in tóm tắt theo run)
+    node_metrics = out.pop("_metrics", None)
+    if node_metrics:
+        run_metrics = state["status"].setdefault("metrics", {})
+        run_metrics[node_name] = merge_metrics(run_metrics.get(node_name), node_metrics)
+
     if status not in ("done", "failed", "retry"):
         warn_msg = f"Node '{node_name}' returned unknown status: {status}. Treating as failed."
         print("WARNING:", warn_msg)
@@ -98,7 +240,8 @@ def runner_node(state: State) -> State:
         if retries[node_name] < policy.max_retry:
             retries[node_name] += 1
             state["retries"] = retries
-            return state
+            record_retry("node", node_name)
+            return
         else:
             status = "failed"
 
@@ -106,22 +249,23 @@ def runner_node(state: State) -> State:
         if retries[node_name] < policy.max_retry:
             retries[node_name] += 1
             state["retries"] = retries
-            return state
+            record_retry("node", node_name)
+            return
         else:
-            state["status"]["step"] = step + 1
+            record_node_status(node_name, "failed")
+            finished[node_name] = "failed"
             failed_log(node_name)
             msg = f"Node {node_name} failed and skipped after {retries[node_name]} retries"
             state["messages"].append(HumanMessage(content=msg))
-            return state
+            return
 
     if status == "done":
         msgs = out.get("messages", [])
         if msgs:
             state["messages"].extend(msgs)
 
-        state["status"]["nodes"] = state["status"].get("nodes", {})
-        state["status"]["nodes"][node_name] = "done"
-        state["status"]["step"] = step + 1
+        finished[node_name] = "done"
+        record_node_status(node_name, "done")
 
         state["outputs"][node_name] = out.get("outputs", {})
         if "seo_score" in out or "meta" in out:
@@ -138,16 +282,107 @@ def runner_node(state: State) -> State:
             state["daily"].update(rec)  # merge vào record duy nhất
 
         done_log(node_name)
+
+
+def _working_copy(state: State) -> State:
+    """
+    Bản sao các phần runner/node sửa. State LangGraph đưa vào có thể đang được serialize
+    làm checkpoint → không sửa in-place, chỉ trả về bản mới.
+    """
+    return {
+        **state,
+        "status": copy.deepcopy(state.get("status") or {}),
+        "retries": dict(state.get("retries") or {}),
+        "outputs": copy.deepcopy(state.get("outputs") or {}),
+        "daily": copy.deepcopy(state.get("daily") or {}),
+        "messages": list(state.get("messages") or []),
+    }
+
+
+def _prepare_runnable(state: State) -> List[str]:
+    """Chọn các node sẵn sàng, check policy + log trạng thái bắt đầu."""
+    seq = state["status"].get("sequence", [])
+    finished = state["status"].setdefault("nodes", {})
+
+    retries = state.get("retries") or {}
+
+    runnable = []
+    for node_name in ready_nodes(seq, finished):
+        not_started_log(node_name)
+
+        # check quota + ghi nhận lượt chạy trong 1 bước (không race giữa các run song song);
+        # chỉ tính 1 lượt cho mỗi node trong 1 run, lần retry không trừ quota nữa
+        if retries.get(node_name, 0) == 0 and not policy.try_acquire(node_name):
+            record_node_status(node_name, "quota")
+            finished[node_name] = "failed"
+            failed_log(node_name)
+            continue
+
+        start_log(node_name)
+        runnable.append(node_name)
+    return runnable
+
+
+def _merge_results(state: State, runnable: List[str], results: Dict[str, dict]) -> State:
+    # Merge theo thứ tự sequence → kết quả không phụ thuộc node nào xong trước
+    for node_name in runnable:
+        _apply_result(state, node_name, results[node_name])
+
+    seq = state["status"].get("sequence", [])
+    finished = state["status"]["nodes"]
+    state["status"]["step"] = sum(1 for name in seq if name in finished)
+    return state
+
+
+def _all_finished(state: State) -> bool:
+    seq = state["status"].get("sequence", [])
+    finished = state["status"].setdefault("nodes", {})
+    if all(name in finished for name in seq):
+        state["status"]["step"] = len(seq)
+        return True
+    return False
+
+
+def runner_node(state: State) -> State:
+    state = _working_copy(state)
+    if _all_finished(state):
         return state
 
+    runnable = _prepare_runnable(state)
+
+    # Chạy song song các node độc lập; 1 node thì chạy luôn trong thread hiện tại
+    if len(runnable) == 1:
+        results = {runnable[0]: _call_node(runnable[0], state)}
+    else:
+        futures = {name: _executor.submit(_call_node, name, state) for name in runnable}
+        results = {name: fut.result() for name, fut in futures.items()}
+
+    return _merge_results(state, runnable, results)
+
+
+async def arunner_node(state: State) -> State:
+    """Bản async của runner_node: chạy các node sẵn sàng bằng asyncio.gather trên event loop."""
+    state = _working_copy(state)
+    if _all_finished(state):
+        return state
+
+    # policy.try_acquire là giao dịch SQLite (BEGIN IMMEDIATE có thể chờ khoá của process khác)
+    # → chạy ở thread, không chặn event loop; state ở đây là bản sao riêng của runner
+    runnable = await asyncio.to_thread(_prepare_runnable, state)
+    outs = await asyncio.gather(*(_acall_node(name, state) for name in runnable))
+    results = dict(zip(runnable, outs))
+
+    return _merge_results(state, runnable, results)
+
 # =========================
 # Build workflow graph
 # =========================
-def build_graph():
+def build_graph(async_mode: bool = False):
+    """async_mode=True → runner async, dùng với graph.ainvoke trong event loop."""
     workflow = StateGraph(State)
 
     workflow.add_node("decide_sequence", decide_sequence_node)
-    workflow.add_node("runner", runner_node)
+    workflow.add_node("runner", arunner_node if async_mode else runner_node)
     workflow.add_node("finalize", finalize_node)
 
     workflow.set_entry_point("decide_sequence")
@@ -1,42 +1,151 @@
 # notion_logger.py
-from services.notion_service import NotionService
+import asyncio
+import concurrent.futures
+import threading
+from typing import Dict, Optional
+from services.notion_service import AsyncNotionService
+from services.registry import lazy
 
-notion = NotionService()
+# NotionService tạo ở lần dùng đầu (registry dùng chung với scheduler)
+notion = lazy("notion")
+# Bản async cho status node, chạy trên event loop riêng của StatusWriter
+notion_async = lazy("notion_async")
 
-def not_started_log(node_name: str):
-    """Node chưa chạy → 'Chưa làm'"""
+
+# =========================
+# Write-behind queue cho status node
+# =========================
+class StatusWriter:
+    """
+    Ghi status task lên Notion từ event loop nền riêng (thread "notion-status-writer")
+    để runner (sync hay async) không phải chờ Notion.
+    - Gửi qua AsyncNotionService: 1 client httpx dùng chung, update liên tiếp của cùng node
+      trong NOTION_COALESCE_WINDOW gộp thành 1 PATCH ("Đang làm" rồi "Hoàn thành" → chỉ gửi "Hoàn thành").
+    - Gửi lỗi thì retry với backoff (không chờ sau lần thử cuối); đã có update mới hơn cho
+      node thì bỏ lượt retry của bản cũ.
+    - flush() chờ gửi hết, close() gửi hết rồi đóng client và dừng loop (dùng khi shutdown).
+    """
+
+    def __init__(self, service: AsyncNotionService, max_retry: int = 3, backoff: float = 1.0):
+        self.service = service
+        self.max_retry = max_retry
+        self.backoff = backoff
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # chỉ đọc/ghi trên loop của writer
+        self._seq: Dict[str, int] = {}
+        self._inflight: set = set()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=loop.run_forever, name="notion-status-writer", daemon=True
+                )
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def put(self, task_name: str, properties: dict):
+        self._ensure_loop().call_soon_threadsafe(self._spawn, task_name, properties)
+
+    def _spawn(self, task_name: str, properties: dict):
+        seq = self._seq.get(task_name, 0) + 1
+        self._seq[task_name] = seq
+        task = asyncio.ensure_future(self._send(task_name, properties, seq))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, task_name: str, properties: dict, seq: int):
+        for attempt in range(self.max_retry):
+            # Có update mới hơn cho node này → bản mới tự gửi, bỏ bản cũ
+            if attempt and self._seq.get(task_name) != seq:
+                return
+            try:
+                if await self.service.update_task(task_name, properties):
+                    return
+            except Exception as e:
+                print(f"⚠️ Lỗi ghi status '{task_name}' (lần {attempt + 1}):", e)
+            if attempt < self.max_retry - 1:
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+        print(f"⚠️ Bỏ status '{task_name}' sau {self.max_retry} lần thử")
+
+    async def _drain(self):
+        while self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+        await self.service.flush()
+
+    async def _aclose(self):
+        await self._drain()
+        await self.service.aclose()
+
+    def _run(self, coro_fn, timeout: float) -> bool:
+        with self._lock:
+            loop = self._loop
+        if loop is None:
+            return True
+        fut = asyncio.run_coroutine_threadsafe(coro_fn(), loop)
+        try:
+            fut.result(timeout)
+            return True
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            return False
+
+    def flush(self, timeout: float = 30) -> bool:
+        """Chờ tới khi gửi hết; trả về False nếu quá timeout."""
+        return self._run(self._drain, timeout)
+
+    def close(self, timeout: float = 30) -> bool:
+        """Gửi hết, đóng client httpx rồi dừng loop nền. put() sau đó sẽ mở loop mới."""
+        ok = self._run(self._aclose, timeout)
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            if not thread.is_alive():
+                loop.close()
+        return ok
+
+
+status_writer = StatusWriter(notion_async)
+
+
+def flush_logs(timeout: float = 30) -> bool:
+    """Gửi nốt các status còn trong hàng đợi, đóng client Notion async (gọi khi shutdown)."""
+    return status_writer.close(timeout)
+
+
+def _log_status(node_name: str, status_name: str, label: str):
     try:
-        notion.update_task(node_name, {"Status": {"status": {"name": "Chưa làm"}}})
+        status_writer.put(node_name, {"Status": {"status": {"name": status_name}}})
     except Exception as e:
-        print("⚠️ Lỗi not_started_log node:", e)
+        print(f"⚠️ Lỗi {label} node:", e)
+
+
+def not_started_log(node_name: str):
+    """Node chưa chạy → 'Chưa làm'"""
+    _log_status(node_name, "Chưa làm", "not_started_log")
 
 def start_log(node_name: str):
     """Node vừa bắt đầu → 'Đang làm'"""
-    try:
-        notion.update_task(node_name, {"Status": {"status": {"name": "Đang làm"}}})
-    except Exception as e:
-        print("⚠️ Lỗi start_log node:", e)
+    _log_status(node_name, "Đang làm", "start_log")
 
 def doing_log(node_name: str):
     """Node đang chạy → 'Đang làm'"""
-    try:
-        notion.update_task(node_name, {"Status": {"status": {"name": "Đang làm"}}})
-    except Exception as e:
-        print("⚠️ Lỗi doing_log node:", e)
+    _log_status(node_name, "Đang làm", "doing_log")
 
 def done_log(node_name: str):
     """Node hoàn thành → 'Hoàn thành'"""
-    try:
-        notion.update_task(node_name, {"Status": {"status": {"name": "Hoàn thành"}}})
-    except Exception as e:
-        print("⚠️ Lỗi done_log node:", e)
+    _log_status(node_name, "Hoàn thành", "done_log")
 
 def failed_log(node_name: str):
     """Node lỗi → 'Bị lỗi'"""
-    try:
-        notion.update_task(node_name, {"Status": {"status": {"name": "Bị lỗi"}}})
-    except Exception as e:
-        print("⚠️ Lỗi failed_log node:", e)
+    _log_status(node_name, "Bị lỗi", "failed_log")
 
 
 def _safe_text(text: str, max_len: int = 1900) -> str:
@@ -1,30 +1,129 @@
 # brain/policy.py
-from datetime import date
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# Lưu lịch sử chạy node trên SQLite → quota không reset khi restart, nhiều thread/process dùng chung
+POLICY_DB = os.getenv("POLICY_DB", ".cache/policy.sqlite")
+POLICY_MAX_PER_DAY = int(os.getenv("POLICY_MAX_PER_DAY", "3"))   # mỗi node tối đa chạy 3 lần/ngày
+POLICY_MAX_RETRY = int(os.getenv("POLICY_MAX_RETRY", "2"))       # tối đa retry cho mỗi node
+
+def _parse_rate_limits(raw: str) -> Dict[str, Tuple[int, float]]:
+    """'facebook=1/600,publish=1/600' → {"facebook": (1, 600.0), ...}"""
+    limits = {}
+    for item in raw.split(","):
+        name, _, spec = item.strip().partition("=")
+        if not name or not spec:
+            continue
+        runs, _, window = spec.partition("/")
+        limits[name.strip()] = (int(runs), float(window or 86400))
+    return limits
+
+
+# Giới hạn theo cửa sổ trượt: node -> (số lần tối đa, cửa sổ giây); mặc định không giới hạn
+# vd POLICY_RATE_LIMITS="facebook=1/600,publish=1/600" → đăng tối đa 1 lần / 10 phút
+NODE_RATE_LIMITS: Dict[str, Tuple[int, float]] = _parse_rate_limits(os.getenv("POLICY_RATE_LIMITS", ""))
+
+# Giới hạn theo ngày riêng cho từng node (không khai báo → POLICY_MAX_PER_DAY)
+NODE_DAILY_CAPS: Dict[str, int] = {}
+
+_HISTORY_KEEP = 2 * 86400  # giữ lịch sử 2 ngày là đủ cho cả daily cap lẫn window
+
+
+def _start_of_day(now: float) -> float:
+    return datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
 
 class PolicyEngine:
-    def __init__(self):
-        # Giới hạn đơn giản theo node (có thể nâng cấp lưu DB)
-        self.daily_counts = {}           # { node_name: count_today }
-        self.max_per_day = 3             # mỗi node tối đa chạy 3 lần/ngày
-        self.max_retry = 2               # tối đa retry cho mỗi node
+    """
+    Quota chạy node:
+    - Daily cap theo ngày (giờ local), tính từ lịch sử chạy.
+    - Rate limit cửa sổ trượt theo node (NODE_RATE_LIMITS).
+    - try_acquire() check + ghi nhận trong cùng 1 transaction → không race khi chạy song song.
+    """
+
+    def __init__(self, path: Optional[str] = POLICY_DB, max_per_day: int = POLICY_MAX_PER_DAY,
+                 max_retry: int = POLICY_MAX_RETRY, rate_limits: Optional[Dict[str, Tuple[int, float]]] = None,
+                 daily_caps: Optional[Dict[str, int]] = None):
+        self.max_per_day = max_per_day
+        self.max_retry = max_retry
+        self.rate_limits = dict(NODE_RATE_LIMITS if rate_limits is None else rate_limits)
+        self.daily_caps = dict(NODE_DAILY_CAPS if daily_caps is None else daily_caps)
+        self._lock = threading.Lock()
 
-        # optional: track date so counts reset mỗi ngày
-        self._last_day = date.today()
+        db = path or ":memory:"
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # isolation_level=None → tự quản lý transaction (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(db, check_same_thread=False, isolation_level=None, timeout=30)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS node_runs (node TEXT NOT NULL, ts REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_node_runs ON node_runs(node, ts)")
+        self._last_prune = 0.0
 
-    def _maybe_reset(self):
-        today = date.today()
-        if today != self._last_day:
-            self.daily_counts = {}
-            self._last_day = today
+    # ---------------- internal ----------------
+    def _count_since(self, node_name: str, since: float) -> int:
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM node_runs WHERE node = ? AND ts >= ?", (node_name, since)
+        ).fetchone()
+        return count
+
+    def _allowed(self, node_name: str, now: float) -> bool:
+        cap = self.daily_caps.get(node_name, self.max_per_day)
+        if self._count_since(node_name, _start_of_day(now)) >= cap:
+            return False
+        limit = self.rate_limits.get(node_name)
+        if limit:
+            max_runs, window = limit
+            if self._count_since(node_name, now - window) >= max_runs:
+                return False
+        return True
+
+    def _prune(self, now: float):
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        self._conn.execute("DELETE FROM node_runs WHERE ts < ?", (now - _HISTORY_KEEP,))
+
+    # ---------------- public API ----------------
+    def try_acquire(self, node_name: str) -> bool:
+        """can_run + register_run nguyên tử: True nếu được chạy (đã ghi nhận 1 lượt)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # khoá ghi cả với process khác
+            try:
+                allowed = self._allowed(node_name, now)
+                if allowed:
+                    self._conn.execute("INSERT INTO node_runs(node, ts) VALUES (?, ?)", (node_name, now))
+                    self._prune(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return allowed
 
     def can_run(self, node_name: str) -> bool:
-        self._maybe_reset()
-        return self.daily_counts.get(node_name, 0) < self.max_per_day
+        with self._lock:
+            return self._allowed(node_name, time.time())
 
     def register_run(self, node_name: str):
-        self._maybe_reset()
-        self.daily_counts[node_name] = self.daily_counts.get(node_name, 0) + 1
+        with self._lock:
+            self._conn.execute("INSERT INTO node_runs(node, ts) VALUES (?, ?)", (node_name, time.time()))
 
     def can_retry(self, node_name: str) -> bool:
         # You can add extra logic here, for now always allow
         return True
+
+    @property
+    def daily_counts(self) -> Dict[str, int]:
+        """{ node_name: count_today }"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT node, COUNT(*) FROM node_runs WHERE ts >= ? GROUP BY node",
+                (_start_of_day(time.time()),),
+            ).fetchall()
+        return dict(rows)
@@ -1,40 +1,103 @@
-from typing import List
+import os
+import json
+import hashlib
+from typing import List, Optional, Sequence
+
+import joblib
+import sklearn
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.multioutput import MultiOutputClassifier
 from sklearn.tree import DecisionTreeClassifier
 
+# File lưu model đã train (xoá file hoặc đổi TRAIN_DATA → tự train lại)
+TINYML_MODEL_PATH = os.getenv("TINYML_MODEL_PATH", ".cache/tiny_ml.joblib")
+
+# Node mapping
+NODE_LIST = ["data_analysis", "create_daily", "human_reference", "keyword", "research", "title", "content", "facebook"]
+
+# Sample training data
+TRAIN_DATA = [
+    ("mở quẻ",  ["data_analysis", "create_daily", "human_reference", "content", "facebook"]),
+    ("đọc quẻ",  ["data_analysis", "create_daily", "human_reference", "content", "facebook"]),
+    ("xem quẻ",   ["data_analysis", "create_daily", "human_reference", "content", "facebook"]),
+    ("Bắt đầu workflow",  ["keyword", "research", "title", "content", "publish"]),
+    ("Workflow đầy đủ",  ["keyword", "research", "title", "content", "publish"]),
+    ("Chỉ tiêu đề và nội dung", ["title","content"]),
+    ("Chỉ SEO và xuất bản", ["seo","publish"])
+]
+
+
+def data_version() -> str:
+    """Hash của dữ liệu train + node list + version sklearn → đổi gì cũng train lại."""
+    raw = json.dumps([NODE_LIST, TRAIN_DATA, sklearn.__version__], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _train():
+    prompts, sequences = zip(*TRAIN_DATA)
+
+    # Vector hóa prompt
+    vectorizer = CountVectorizer()
+    X = vectorizer.fit_transform(prompts)
+
+    # Multi-label encoding
+    Y = [[1 if node in seq else 0 for node in NODE_LIST] for seq in sequences]
+
+    # Train tiny model (random_state cố định → cùng data thì cùng cây)
+    clf = MultiOutputClassifier(DecisionTreeClassifier(random_state=0))
+    clf.fit(X, Y)
+    return vectorizer, clf
+
+
+def _load(path: str, version: str):
+    try:
+        data = joblib.load(path)
+    except Exception:
+        return None
+    if not isinstance(data, dict) or data.get("version") != version:
+        return None
+    return data["vectorizer"], data["clf"]
+
+
+def _save(path: str, version: str, vectorizer, clf):
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.tmp"
+    joblib.dump({"version": version, "vectorizer": vectorizer, "clf": clf}, tmp)
+    os.replace(tmp, path)
+
+
 class TinyML:
-    def __init__(self):
-        # Node mapping
-        self.node_list = ["data_analysis", "create_daily", "human_reference", "keyword", "research", "title", "content", "facebook"]
-        # Sample training data
-        train_data = [
-            ("mở quẻ",  ["data_analysis", "create_daily", "human_reference", "content", "facebook"]),
-            ("đọc quẻ",  ["data_analysis", "create_daily", "human_reference", "content", "facebook"]),
-            ("xem quẻ",   ["data_analysis", "create_daily", "human_reference", "content", "facebook"]),
-            ("Bắt đầu workflow",  ["keyword", "research", "title", "content", "publish"]),
-            ("Workflow đầy đủ",  ["keyword", "research", "title", "content", "publish"]),
-            ("Chỉ tiêu đề và nội dung", ["title","content"]),
-            ("Chỉ SEO và xuất bản", ["seo","publish"])
-        ]
-        prompts, sequences = zip(*train_data)
+    """
+    Router chọn sequence node từ câu lệnh người dùng.
+    Model train 1 lần rồi lưu joblib kèm version hash dữ liệu train; lần sau chỉ load.
+    """
 
-        # Vector hóa prompt
-        self.vectorizer = CountVectorizer()
-        X = self.vectorizer.fit_transform(prompts)
+    def __init__(self, path: Optional[str] = TINYML_MODEL_PATH):
+        self.node_list = NODE_LIST
+        self.version = data_version()
+        loaded = _load(path, self.version) if path else None
+        if loaded is not None:
+            self.vectorizer, self.clf = loaded
+            return
 
-        # Multi-label encoding
-        Y = []
-        for seq in sequences:
-            y = [1 if node in seq else 0 for node in self.node_list]
-            Y.append(y)
+        self.vectorizer, self.clf = _train()
+        if path:
+            try:
+                _save(path, self.version, self.vectorizer, self.clf)
+            except Exception as e:
+                print("⚠️ Không lưu được TinyML model:", e)
 
-        # Train tiny model
-        self.clf = MultiOutputClassifier(DecisionTreeClassifier())
-        self.clf.fit(X, Y)
+    def decide_sequences(self, prompts: Sequence[str]) -> List[List[str]]:
+        """Dự đoán sequence cho nhiều prompt trong 1 lần transform/predict."""
+        if not prompts:
+            return []
+        X = self.vectorizer.transform(list(prompts))
+        y_pred = self.clf.predict(X)
+        return [
+            [node for node, active in zip(self.node_list, row) if active]
+            for row in y_pred
+        ]
 
     def decide_sequence(self, prompt: str) -> List[str]:
-        X_test = self.vectorizer.transform([prompt])
-        y_pred = self.clf.predict(X_test)[0]
-        sequence = [node for node, active in zip(self.node_list, y_pred) if active]
-        return sequence
+        return self.decide_sequences([prompt])[0]
@@ -0,0 +1,61 @@
+"""
+Kiểm tra thời gian import lúc khởi động (chạy trong CI / lúc build Docker):
+
+    python check_import_budget.py
+
+Mỗi module được import trong 1 process sạch; fail (exit 1) nếu quá IMPORT_BUDGET_SECONDS
+hoặc nếu kéo theo thư viện nặng chỉ được phép load lazy khi node chạy.
+"""
+import os
+import sys
+import json
+import subprocess
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "3.0"))
+
+# Module nằm trên đường khởi động của `uvicorn app:app`
+STARTUP_MODULES = ["brain.nodes", "flows.workflow_run", "flows.flows", "schedulers.jobs"]
+
+# Thư viện nặng không được có mặt sau khi import các module trên
+FORBIDDEN_AT_STARTUP = [
+    "sklearn", "chromadb", "sentence_transformers", "moviepy", "cv2", "PIL",
+    "langchain_community", "langchain_google_genai", "langchain_openai", "networkx",
+]
+
+_PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+heavy = [m for m in {forbidden!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure(module: str) -> dict:
+    code = _PROBE.format(module=module, forbidden=FORBIDDEN_AT_STARTUP)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "exit %d" % proc.returncode}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    ok = True
+    for module in STARTUP_MODULES:
+        result = measure(module)
+        if "error" in result:
+            print(f"❌ {module}: import lỗi — {result['error']}")
+            ok = False
+            continue
+        elapsed, heavy = result["elapsed"], result["heavy"]
+        status = "✅" if elapsed <= IMPORT_BUDGET_SECONDS and not heavy else "❌"
+        print(f"{status} {module}: {elapsed:.2f}s (budget {IMPORT_BUDGET_SECONDS:.1f}s)"
+              + (f", kéo theo: {', '.join(heavy)}" if heavy else ""))
+        ok = ok and status == "✅"
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 import logging
 from typing import Dict, Any, Optional
-from flows.workflow_run import start_workflow, running 
+from flows import workflow_run
 from services.llm_service import llm
 
 logger = logging.getLogger(__name__)
@@ -32,18 +32,16 @@ async def process_message(
     """
     logger.info(f"🚀 Bắt đầu flow xử lý tin nhắn cho user {user_id}")
 
-    # Kiểm tra xem workflow có đang chạy không
-    workflow_running = running
-
     # 1️⃣ Phân tích tin nhắn để quyết định bật workflow
     want_to_start = await analyze_message_for_workflow(message, user_id)
 
-    if want_to_start and not workflow_running:
+    if want_to_start:
         logger.info(f"💡 LLM quyết định bật workflow cho user {user_id}")
-        start_workflow()
-        llm_response = "✅ Workflow đã được bật!"
-    elif want_to_start and workflow_running:
-        llm_response = "⚠️ Workflow đang chạy rồi."
+        run_id = workflow_run.start_workflow()
+        if run_id:
+            llm_response = f"✅ Workflow đã được bật! (run: {run_id})"
+        else:
+            llm_response = "⚠️ Đang có quá nhiều workflow chờ chạy, thử lại sau."
     else:
         # Trả lời bình thường qua LLM
         llm_response = await llm.ainvoke(message)
@@ -1,39 +1,139 @@
+import os
+import sqlite3
 import uuid
+import asyncio
 import threading
 import logging
 import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
 
-from langgraph.checkpoint.memory import MemorySaver
+import aiosqlite
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langchain_core.messages import HumanMessage
 from brain.nodes import build_graph
 from brain.types import State
 
 logger = logging.getLogger("workflow")
 
-running = False
 graph = None
+agraph = None
+_agraph_loop = None
+_agraph_conn = None
+_prune_task = None
+_last_prune = 0.0
 
-lock = threading.Lock()
+# Checkpoint lưu SQLite (WAL) → restart vẫn resume được run dang dở
+WORKFLOW_DB = os.getenv("WORKFLOW_DB", ".cache/workflow_checkpoints.sqlite")
 
-def setup_graph():
-    """Khởi tạo workflow"""
-    memory = MemorySaver()
-    workflow = build_graph()
-    compiled = workflow.compile(checkpointer=memory)
+# "sync": ghi checkpoint xong mới chạy bước tiếp → crash giữa chừng vẫn còn bước đã hoàn thành cuối cùng
+# ("async" ghi song song với bước sau, "exit" chỉ ghi khi run kết thúc)
+CHECKPOINT_DURABILITY = os.getenv("WORKFLOW_DURABILITY", "sync")
+
+# Xoá checkpoint của run đã xong (finalize) cũ hơn N ngày; 0 = giữ mãi. Kiểm tra tối đa 1 lần / ngày
+WORKFLOW_RETENTION_DAYS = float(os.getenv("WORKFLOW_RETENTION_DAYS", "14"))
+WORKFLOW_PRUNE_INTERVAL = 24 * 3600
+
+# Số workflow chạy đồng thời & số run tối đa được xếp hàng chờ
+WORKFLOW_WORKERS = int(os.getenv("WORKFLOW_WORKERS", "2"))
+WORKFLOW_QUEUE_SIZE = int(os.getenv("WORKFLOW_QUEUE_SIZE", "10"))
+WORKFLOW_HISTORY = int(os.getenv("WORKFLOW_HISTORY", "100"))
+
+def _ensure_db_dir(path: str):
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+
+
+def setup_graph(async_mode: bool = False, checkpointer=None):
+    """
+    Khởi tạo workflow (async_mode=True → dùng với graph.ainvoke).
+    Mặc định checkpoint vào SQLite WORKFLOW_DB; bản async cần truyền AsyncSqliteSaver
+    (tạo trong event loop sẽ dùng nó, xem _get_agraph).
+    """
+    if checkpointer is None:
+        _ensure_db_dir(WORKFLOW_DB)
+        conn = sqlite3.connect(WORKFLOW_DB, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        checkpointer = SqliteSaver(conn)
+    workflow = build_graph(async_mode=async_mode)
+    compiled = workflow.compile(checkpointer=checkpointer)
     return compiled
 
 
-def loop(thread_name: str = "telegram-thread"):
-    """Chạy workflow đúng 1 vòng rồi tắt"""
-    global running, graph
-    if not graph:
-        graph = setup_graph()
+async def _get_agraph():
+    """Graph async + AsyncSqliteSaver, tạo lại nếu gọi từ event loop khác"""
+    global agraph, _agraph_loop, _agraph_conn
+    loop = asyncio.get_running_loop()
+    if agraph is None or _agraph_loop is not loop:
+        _ensure_db_dir(WORKFLOW_DB)
+        conn = await aiosqlite.connect(WORKFLOW_DB)
+        await conn.execute("PRAGMA journal_mode=WAL")
+        agraph = setup_graph(async_mode=True, checkpointer=AsyncSqliteSaver(conn))
+        _agraph_loop = loop
+        _agraph_conn = conn
+    _maybe_prune(agraph.checkpointer)
+    return agraph
+
+
+def _maybe_prune(saver: AsyncSqliteSaver):
+    """Dọn checkpoint cũ ở nền (task trên loop của graph), tối đa 1 lần mỗi WORKFLOW_PRUNE_INTERVAL."""
+    global _prune_task, _last_prune
+    if WORKFLOW_RETENTION_DAYS <= 0 or time.time() - _last_prune < WORKFLOW_PRUNE_INTERVAL:
+        return
+    if _prune_task is not None and not _prune_task.done():
+        return
+    _last_prune = time.time()
+    _prune_task = asyncio.get_running_loop().create_task(aprune_checkpoints(saver))
+
+
+async def aprune_checkpoints(saver: AsyncSqliteSaver, days: float = WORKFLOW_RETENTION_DAYS) -> int:
+    """
+    Xoá checkpoint + writes của các thread đã finalize (status["state"] == "done")
+    mà checkpoint cuối cũ hơn `days` ngày. Run dang dở/lỗi được giữ để còn resume.
+    Trả về số thread đã xoá.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    await saver.setup()
+    async with saver.conn.execute("SELECT DISTINCT thread_id FROM checkpoints") as cur:
+        thread_ids = [row[0] for row in await cur.fetchall()]
+
+    removed = 0
+    for thread_id in thread_ids:
+        try:
+            tup = await saver.aget_tuple({"configurable": {"thread_id": thread_id}})
+            if tup is None:
+                continue
+            ts = datetime.fromisoformat(tup.checkpoint["ts"])
+            status = _status_dict(tup.checkpoint.get("channel_values") or {})
+            if status.get("state") != "done" or ts >= cutoff:
+                continue
+            await saver.adelete_thread(thread_id)
+            removed += 1
+        except Exception as e:
+            logger.warning("⚠️ Lỗi dọn checkpoint %s: %s", thread_id, e)
+    if removed:
+        logger.info("🧹 Đã xoá checkpoint của %s run cũ hơn %s ngày", removed, days)
+    return removed
+
+
+async def aclose_graph():
+    """Đóng kết nối SQLite của graph async (thread của aiosqlite chặn process thoát nếu để mở)"""
+    global agraph, _agraph_loop, _agraph_conn, _prune_task
+    if _agraph_conn is not None and _agraph_loop is asyncio.get_running_loop():
+        if _prune_task is not None and not _prune_task.done():
+            _prune_task.cancel()
+            await asyncio.gather(_prune_task, return_exceptions=True)
+        await _agraph_conn.close()
+    agraph = _agraph_loop = _agraph_conn = _prune_task = None
 
-    thread_id = str(uuid.uuid4())
-    config = {"configurable": {"thread_id": thread_id}}
 
-    init_state: State = {
-        "messages": [HumanMessage(content="mở quẻ")],
+def new_init_state(message: str = "mở quẻ") -> State:
+    """State ban đầu cho 1 lần chạy workflow"""
+    return {
+        "messages": [HumanMessage(content=message)],
         "outputs": {
             "keyword": [],
             "research": [],
@@ -77,52 +177,258 @@ def loop(thread_name: str = "telegram-thread"):
             }
     }
 
+
+def loop(thread_name: str = "telegram-thread"):
+    """Chạy workflow đúng 1 vòng (sync, dùng cho script/debug)"""
+    global graph
+    if not graph:
+        graph = setup_graph()
+
+    thread_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": thread_id}}
+
+    init_state = new_init_state()
+
     # 1. Chạy workflow
-    state1 = graph.invoke(init_state, config=config)
+    state1 = graph.invoke(init_state, config=config, durability=CHECKPOINT_DURABILITY)
     logger.info("Kết quả workflow:")
     for msg in state1["messages"]:
         logger.info("- %s", msg.content)
 
-    # 2. Resume trước publish
-    # history = list(graph.get_state_history(config))
-    # cp = next(
-    #     (
-    #         h for h in reversed(history)
-    #         if not any(
-    #             "publish" in (m.content if hasattr(m, "content") else str(m)).lower()
-    #             for m in h.values.get("messages", [])
-    #         )
-    #     ),
-    #     None
-    # )
-
-    # if cp:
-    #     resumed_state = graph.invoke(
-    #         None,
-    #         config={
-    #             "configurable": {
-    #                 "thread_id": thread_id,
-    #                 "checkpoint_id": cp.config["configurable"]["checkpoint_id"]
-    #             }
-    #         },
-    #     )
-    #     logger.info("Kết quả resume trước publish:")
-    #     for msg in resumed_state["messages"]:
-    #         logger.info("- %s", msg.content)
-
-    # ✅ tự tắt sau khi chạy xong
-    running = False
     logger.info("Workflow đã hoàn tất và dừng.")
 
     # time.sleep(999999)  # delay cực dài
 
 
-def start_workflow():
-    global running
-    with lock:
-        if not running:
-            running = True
-            logger.info("=== BẮT ĐẦU workflow thread ===")
-            threading.Thread(target=loop, daemon=True).start()
-        else:
-            logger.info("⚠️ Workflow đã chạy, bỏ qua request mới")
+async def aloop(message: str = "mở quẻ", thread_id: Optional[str] = None) -> dict:
+    """Chạy workflow 1 vòng trong event loop hiện tại (graph.ainvoke, không cần thread riêng)"""
+    graph_ = await _get_agraph()
+
+    config = {"configurable": {"thread_id": thread_id or str(uuid.uuid4())}}
+    result = await graph_.ainvoke(new_init_state(message), config=config, durability=CHECKPOINT_DURABILITY)
+    logger.info("Kết quả workflow:")
+    for msg in result["messages"]:
+        logger.info("- %s", msg.content)
+    logger.info("Workflow đã hoàn tất và dừng.")
+    return result
+
+
+async def aresume(thread_id: str) -> Optional[dict]:
+    """
+    Chạy tiếp run từ checkpoint cuối cùng của thread_id (vd sau khi crash/restart).
+    - Run chỉ coi là xong khi finalize đã chạy (status["state"] == "done"), không dựa vào
+      việc checkpoint hết task chờ.
+    - Node đã "done" trong state["status"]["nodes"] không chạy lại, outputs được giữ nguyên.
+    - Node lỗi "failed" được chạy lại (reset retries của node đó).
+    Trả về None nếu không có checkpoint nào cho thread_id.
+    """
+    graph_ = await _get_agraph()
+    config = {"configurable": {"thread_id": thread_id}}
+    snapshot = await graph_.aget_state(config)
+    if not snapshot or not snapshot.values:
+        return None
+
+    values = snapshot.values
+    status = _status_dict(values)
+    finished = status.get("nodes", {})
+    failed = [name for name, st in finished.items() if st == "failed"]
+    if status.get("state") == "done" and not failed:
+        logger.info("Run %s đã hoàn tất, không cần resume", thread_id)
+        return values
+
+    logger.info("▶️ Resume run %s (done: %s)", thread_id, [n for n, st in finished.items() if st == "done"])
+    seq = status.get("sequence")
+    if failed or (not snapshot.next and isinstance(seq, list)):
+        # Bỏ đánh dấu failed để runner chạy lại; các node done vẫn được bỏ qua.
+        # Checkpoint không còn task chờ nhưng chưa finalize → cũng đưa về runner.
+        retries = dict(values.get("retries") or {})
+        for name in failed:
+            retries.pop(name, None)
+        nodes = {name: st for name, st in finished.items() if st != "failed"}
+        new_status = {k: v for k, v in status.items() if k != "state"}
+        new_status.update(nodes=nodes, step=sum(1 for n in seq or [] if n in nodes))
+        await graph_.aupdate_state(config, {"status": new_status, "retries": retries}, as_node="decide_sequence")
+        result = await graph_.ainvoke(None, config=config, durability=CHECKPOINT_DURABILITY)
+    elif snapshot.next:
+        result = await graph_.ainvoke(None, config=config, durability=CHECKPOINT_DURABILITY)
+    else:
+        # Chỉ còn checkpoint input (crash trước khi chọn sequence) → chạy lại từ đầu với input đó
+        result = await graph_.ainvoke(values, config=config, durability=CHECKPOINT_DURABILITY)
+    logger.info("Workflow đã hoàn tất và dừng.")
+    return result
+
+
+# =========================
+# Run manager: hàng đợi có giới hạn + pool worker, tra cứu theo run_id
+# =========================
+@dataclass
+class WorkflowRun:
+    run_id: str
+    thread_id: str
+    message: str
+    resume: bool = False
+    status: str = "queued"  # queued | running | done | failed
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _status_dict(state: dict) -> dict:
+    """state["status"] luôn phải là dict tiến độ; checkpoint cũ có thể còn là string ("done")."""
+    status = (state or {}).get("status")
+    return status if isinstance(status, dict) else {}
+
+
+def _summarize(state: dict) -> dict:
+    """Rút gọn state cuối để lưu làm kết quả run"""
+    return {
+        "messages": [getattr(m, "content", str(m)) for m in state.get("messages", [])],
+        "nodes": _status_dict(state).get("nodes", {}),
+        "outputs": state.get("outputs", {}),
+    }
+
+
+class WorkflowRunManager:
+    """
+    Chạy nhiều workflow đồng thời trên 1 event loop nền (thread riêng của manager).
+    - submit() không chặn, trả về run_id; trả về None nếu hàng đợi đầy.
+    - Tối đa `workers` run chạy cùng lúc, mỗi run có thread_id (checkpoint) riêng.
+    - get(run_id) trả về trạng thái/kết quả; giữ `history` run gần nhất.
+    """
+
+    def __init__(self, workers: int = WORKFLOW_WORKERS, queue_size: int = WORKFLOW_QUEUE_SIZE,
+                 history: int = WORKFLOW_HISTORY):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.history = history
+        self.runs: "OrderedDict[str, WorkflowRun]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._serve, args=(ready,), name="workflow-runs", daemon=True)
+            self._thread.start()
+        ready.wait()
+
+    def _serve(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        for i in range(self.workers):
+            self._loop.create_task(self._worker(i))
+        ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def submit(self, message: str = "mở quẻ", run_id: Optional[str] = None, resume: bool = False) -> Optional[str]:
+        self.start()
+        with self._lock:
+            if self._queued >= self.queue_size:
+                logger.info("⚠️ Hàng đợi workflow đầy (%s), bỏ qua request mới", self.queue_size)
+                return None
+            existing = self.runs.get(run_id) if run_id else None
+            if existing and existing.status in ("queued", "running"):
+                logger.info("⚠️ Run %s đang chạy, bỏ qua", run_id)
+                return run_id
+            self._queued += 1
+            # run_id dùng luôn làm thread_id của checkpoint → resume được cả sau restart
+            run_id = run_id or uuid.uuid4().hex
+            run = WorkflowRun(run_id=run_id, thread_id=run_id, message=message, resume=resume)
+            self.runs[run.run_id] = run
+            self._evict()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, run)
+        logger.info("=== Xếp hàng workflow run %s ===", run.run_id)
+        return run.run_id
+
+    def resume(self, run_id: str) -> Optional[str]:
+        """Xếp hàng chạy tiếp run_id từ checkpoint SQLite cuối cùng"""
+        return self.submit(run_id=run_id, resume=True)
+
+    def get(self, run_id: str) -> Optional[dict]:
+        with self._lock:
+            run = self.runs.get(run_id)
+            return run.to_dict() if run else None
+
+    def active(self) -> List[dict]:
+        with self._lock:
+            return [r.to_dict() for r in self.runs.values() if r.status in ("queued", "running")]
+
+    def is_busy(self) -> bool:
+        with self._lock:
+            return any(r.status in ("queued", "running") for r in self.runs.values())
+
+    def _evict(self):
+        finished = [rid for rid, r in self.runs.items() if r.status in ("done", "failed")]
+        for rid in finished[:max(0, len(self.runs) - self.history)]:
+            del self.runs[rid]
+
+    async def _worker(self, idx: int):
+        while True:
+            run = await self._queue.get()
+            with self._lock:
+                self._queued -= 1
+                run.status = "running"
+                run.started_at = time.time()
+            try:
+                if run.resume:
+                    state = await aresume(run.thread_id)
+                    if state is None:
+                        raise ValueError(f"Không có checkpoint cho run {run.run_id}")
+                else:
+                    state = await aloop(run.message, run.thread_id)
+                result, status, error = _summarize(state), "done", None
+            except Exception as e:
+                logger.exception("⚠️ Workflow run %s lỗi", run.run_id)
+                result, status, error = None, "failed", str(e)
+            with self._lock:
+                run.result, run.status, run.error = result, status, error
+                run.finished_at = time.time()
+            self._queue.task_done()
+
+    def shutdown(self, timeout: float = 5):
+        """Dừng event loop nền (các run đang chạy bị huỷ)."""
+        loop, thread = self._loop, self._thread
+        if not loop or not thread or not thread.is_alive():
+            return
+
+        async def _stop():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await aclose_graph()
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(_stop(), loop)
+        thread.join(timeout)
+
+
+manager = WorkflowRunManager()
+
+
+def start_workflow(message: str = "mở quẻ") -> Optional[str]:
+    """Xếp hàng 1 workflow run, trả về run_id (None nếu hàng đợi đầy)"""
+    return manager.submit(message)
+
+
+def get_run(run_id: str) -> Optional[dict]:
+    return manager.get(run_id)
+
+
+def resume_workflow(run_id: str) -> Optional[str]:
+    """Chạy tiếp run đã dừng giữa chừng (crash/restart) từ node hoàn thành cuối cùng"""
+    return manager.resume(run_id)
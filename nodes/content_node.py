@@ -4,8 +4,8 @@ from langchain_core.runnables import RunnableLambda
 from pydantic import BaseModel
 from langchain.output_parsers import PydanticOutputParser
 from services.llm_service import llm  # hoặc Groq wrapper tương ứng
+from services.prompt_context import build_context, report_prompt
 from typing import List
-import json
 import traceback
 
 # 1️⃣ Model JSON chuẩn (theo yêu cầu: 4 trường string)
@@ -29,9 +29,8 @@ def safe_parse(parser, text: str):
 
 # 3️⃣ Node content tối giản với prompt mới
 def content_node(state):
-    record = state.get("daily", {})
-    # Chuẩn bị JSON input để model đọc (dán nguyên state)
-    state_json = json.dumps(record, ensure_ascii=False, indent=2)
+    # Chỉ lấy field cần của daily (bỏ relations của quẻ), cắt theo budget token
+    state_json = build_context("content", state)
 
     parser = PydanticOutputParser(pydantic_object=ContentOutput)
 
@@ -67,6 +66,7 @@ def content_node(state):
         """
 
     # Gọi LLM
+    report_prompt("content", prompt_text)
     llm_output = llm.invoke(prompt_text)
     raw_result = llm_output.content if hasattr(llm_output, "content") else str(llm_output)
 
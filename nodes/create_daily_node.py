@@ -6,7 +6,7 @@ from langchain.output_parsers import PydanticOutputParser
 from brain.types import FullDailyData
 from services.llm_service import llm  # hoặc Groq wrapper
 from typing import List
-from services.daily_hexagram_service import DailyHexagramService
+from services.daily_hexagram_service import get_daily_hexagram_service
 
 # 1️⃣ Model JSON chuẩn
 class DailyOutput(BaseModel):
@@ -17,7 +17,7 @@ class DailyOutput(BaseModel):
 
 def create_daily_node(state):
     record = state.get("daily", {})
-    svc = DailyHexagramService()
+    svc = get_daily_hexagram_service()
     result = svc.create_daily_node(
         record.get("thien"),
         record.get("dia"),
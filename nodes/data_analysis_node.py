@@ -1,17 +1,34 @@
+import asyncio
 import random
 import time
-import requests
 import traceback
+import httpx
 from pydantic import BaseModel
 from langchain_core.messages import HumanMessage
 from langchain.output_parsers import PydanticOutputParser
-from services.groq_service import chat_groq
+from services.groq_service import chat_groq_stream
+from services.prompt_context import PROMPT_BUDGETS, build_context, fit, report_prompt
+from services.metrics import ahttp_event_hooks
 from services.seo_service import SEOContentPipeline
 import feedparser  # để parse RSS Google News
 
 
 MAX_NEWS_LENGTH = 8000  # giới hạn ký tự cho field news
 
+KP_URL = "https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json"
+QUAKE_URL = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson"
+NEWS_URL = "https://news.google.com/rss?hl=vi&gl=VN&ceid=VN:vi"
+
+SEED_KEYWORDS = ["thiên tai", "dịch bệnh", "kinh tế", "thời sự"]
+RETRY_COUNT = 3
+FETCH_TIMEOUT = 10  # giây
+
+# Khoảng cách tối thiểu giữa 2 request tới cùng 1 host (thay cho sleep toàn cục)
+HOST_MIN_INTERVAL = {
+    "trends.google.com": 1.5,
+    "serpapi.com": 1.5,
+}
+
 
 # -----------------------------
 # 1️⃣ Định nghĩa schema output (4 field)
@@ -24,76 +41,112 @@ class DataAnalysisOutput(BaseModel):
 
 
 # -----------------------------
-# 2️⃣ Thu thập dữ liệu đa nguồn
+# 2️⃣ Thu thập dữ liệu đa nguồn (song song)
 # -----------------------------
-def collect_data():
-    results = {"heaven": {}, "earth": {}, "human": {}}
+class HostRateLimiter:
+    """Giãn cách request theo từng host, các host khác nhau không chờ nhau."""
+
+    def __init__(self, intervals: dict):
+        self.intervals = intervals
+        self._locks = {}
+        self._last = {}
+
+    async def wait(self, host: str):
+        interval = self.intervals.get(host, 0)
+        if not interval:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = self._last.get(host, 0) + interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last[host] = time.monotonic()
+
+
+async def _safe_fetch(limiter: HostRateLimiter, host: str, fetch_fn):
+    """Thử lại nhiều lần nếu fetch lỗi, mỗi lần đều đi qua rate limit của host"""
+    for i in range(RETRY_COUNT):
+        await limiter.wait(host)
+        try:
+            return await fetch_fn()
+        except Exception:
+            await asyncio.sleep(2 ** i + random.random())
+    return {"status": "error", "error": "Failed after retries"}
 
+
+async def _fetch_heaven(client: httpx.AsyncClient) -> dict:
+    # Thiên – NOAA Kp Index
     try:
-        # Thiên – NOAA Kp Index
-        try:
-            kp_url = "https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json"
-            kp_data = requests.get(kp_url, timeout=10).json()
-            results["heaven"]["kp_index"] = kp_data[-1] if kp_data else {}
-        except Exception as e:
-            results["heaven"]["error"] = str(e)
+        res = await client.get(KP_URL)
+        kp_data = res.json()
+        return {"kp_index": kp_data[-1] if kp_data else {}}
+    except Exception as e:
+        return {"error": str(e)}
 
-        # Địa – USGS Earthquakes
-        try:
-            quake_url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson"
-            quake_data = requests.get(quake_url, timeout=10).json()
-            results["earth"]["earthquakes"] = quake_data.get("features", [])[:5]
-        except Exception as e:
-            results["earth"]["error"] = str(e)
 
-        # Nhân – Google News RSS
-        try:
-            news_url = "https://news.google.com/rss?hl=vi&gl=VN&ceid=VN:vi"
-            feed = feedparser.parse(news_url)
-            news_items = []
-            for entry in feed.entries[:50]:  # gom 50 tin mới nhất
-                news_items.append(f"{entry.title} - {entry.link}")
-            news_text = "\n".join(news_items)
-            # Cắt giới hạn ký tự
-            if len(news_text) > MAX_NEWS_LENGTH:
-                news_text = news_text[:MAX_NEWS_LENGTH] + "\n[...]"
-            results["human"]["news"] = news_text
-
-           # -----------------------------
-            # SEO / Trends (thay thế phần gốc)
-            # -----------------------------
-            seo = SEOContentPipeline()
-            seed_keywords = ["thiên tai", "dịch bệnh", "kinh tế", "thời sự"]
-            seo_data = {}
-
-            RETRY_COUNT = 3
-            DELAY_BETWEEN_REQUESTS = 1.5  # giây
-
-            def safe_fetch(fetch_fn):
-                """Thử lại nhiều lần nếu fetch lỗi"""
-                for i in range(RETRY_COUNT):
-                    try:
-                        return fetch_fn()
-                    except Exception as e:
-                        wait = 2 ** i + random.random()
-                        time.sleep(wait)
-                return {"status": "error", "error": "Failed after retries"}
-
-            for kw in seed_keywords:
-                seo_data[kw] = {}
-
-                # Lấy related keywords
-                seo_data[kw]["related_keywords"] = safe_fetch(lambda: seo.fetch_keywords(kw))
-                time.sleep(DELAY_BETWEEN_REQUESTS)
-
-                # Lấy competitor titles
-                seo_data[kw]["competitor_titles"] = safe_fetch(lambda: seo.fetch_competitor_titles(kw))
-                time.sleep(DELAY_BETWEEN_REQUESTS)
-
-            results["human"]["seo_trends"] = seo_data
-
-        except Exception as e:
-            results["human"]["error"] = str(e)
+async def _fetch_earth(client: httpx.AsyncClient) -> dict:
+    # Địa – USGS Earthquakes
+    try:
+        res = await client.get(QUAKE_URL)
+        return {"earthquakes": res.json().get("features", [])[:5]}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def _fetch_news(client: httpx.AsyncClient) -> str:
+    # Nhân – Google News RSS
+    res = await client.get(NEWS_URL, follow_redirects=True)
+    feed = feedparser.parse(res.content)
+    news_items = []
+    for entry in feed.entries[:50]:  # gom 50 tin mới nhất
+        news_items.append(f"{entry.title} - {entry.link}")
+    news_text = "\n".join(news_items)
+    # Cắt giới hạn ký tự
+    if len(news_text) > MAX_NEWS_LENGTH:
+        news_text = news_text[:MAX_NEWS_LENGTH] + "\n[...]"
+    return news_text
+
+
+async def _fetch_seo(client: httpx.AsyncClient, limiter: HostRateLimiter) -> dict:
+    # SEO / Trends: pytrends là thư viện sync → chạy trong thread
+    seo = SEOContentPipeline()
+
+    async def fetch_keyword(kw: str):
+        related, competitors = await asyncio.gather(
+            _safe_fetch(limiter, "trends.google.com", lambda: asyncio.to_thread(seo.fetch_keywords, kw)),
+            _safe_fetch(limiter, "serpapi.com", lambda: seo.afetch_competitor_titles(kw, client)),
+        )
+        return {"related_keywords": related, "competitor_titles": competitors}
+
+    values = await asyncio.gather(*(fetch_keyword(kw) for kw in SEED_KEYWORDS))
+    return dict(zip(SEED_KEYWORDS, values))
+
+
+async def collect_data_async() -> dict:
+    results = {"heaven": {}, "earth": {}, "human": {}}
+    limiter = HostRateLimiter(HOST_MIN_INTERVAL)
+
+    try:
+        async with httpx.AsyncClient(timeout=FETCH_TIMEOUT, event_hooks=ahttp_event_hooks()) as client:
+            heaven, earth, news, seo = await asyncio.gather(
+                _fetch_heaven(client),
+                _fetch_earth(client),
+                _fetch_news(client),
+                _fetch_seo(client, limiter),
+                return_exceptions=True,
+            )
+        results["heaven"] = heaven
+        results["earth"] = earth
+
+        # Giữ nguyên hành vi cũ: lỗi news/SEO ghi vào human["error"]
+        if isinstance(news, Exception):
+            results["human"]["error"] = str(news)
+        else:
+            results["human"]["news"] = news
+            if isinstance(seo, Exception):
+                results["human"]["error"] = str(seo)
+            else:
+                results["human"]["seo_trends"] = seo
 
     except Exception as e:
         results["error"] = str(e)
@@ -101,6 +154,11 @@ def collect_data():
     return results
 
 
+def collect_data():
+    """Wrapper sync cho node (node chạy trong thread riêng, không có event loop)."""
+    return asyncio.run(collect_data_async())
+
+
 # -----------------------------
 # 3️⃣ Node chính: gom + phân tích
 # -----------------------------
@@ -114,7 +172,8 @@ def data_analysis_node(state: dict) -> dict:
     parser = PydanticOutputParser(pydantic_object=DataAnalysisOutput)
 
     # 3. Prompt Groq
-    safe_state = {k: ("..." if k == "messages" else v) for k, v in state.items()}
+    safe_state = build_context("data_analysis", state)
+    raw_data = fit(raw_data, PROMPT_BUDGETS["data_analysis"])
     prompt = (
         f"Dữ liệu state: {safe_state}\n\n"
         f"Chủ đề: {topic}\n\n"
@@ -146,8 +205,14 @@ def data_analysis_node(state: dict) -> dict:
     )
 
     # 4. Gọi Groq GPT
+    report_prompt("data_analysis", prompt)
     try:
-        raw_result = chat_groq(prompt)
+        raw_result = chat_groq_stream(
+            prompt,
+            required=DataAnalysisOutput.model_fields,
+            on_field=lambda k, v: print(f"📥 data_analysis_node: xong field {k}"),
+            validate=parser.parse,  # parse lỗi → không lưu cache
+        )
         result = parser.parse(raw_result)
     except Exception as e:
         traceback.print_exc()
@@ -1,6 +1,7 @@
 from langchain_core.messages import HumanMessage
 
 from brain.notion_logger import create_hexagram_log
+from services.metrics import format_summary
 
 def finalize_node(state):
     messages = []
@@ -33,7 +34,15 @@ def finalize_node(state):
     print("✅ Đã gửi dữ liệu lên Notion")
     messages.append(HumanMessage(content="✅ Blog saved to Notion"))
 
+    # --- Tóm tắt thời gian / LLM / HTTP / retry theo node của run này ---
+    status = state.get("status")
+    status = status if isinstance(status, dict) else {}
+    summary = format_summary(status.get("metrics", {}))
+    print(f"📊 Run summary:\n{summary}")
+    messages.append(HumanMessage(content=f"📊 Run summary:\n{summary}"))
+
+    # status vẫn là dict tiến độ của run; đánh dấu hoàn tất ở status["state"]
     return {
-        "status": "done",
-        "messages": messages,
+        "status": {**status, "state": "done"},
+        "messages": list(state.get("messages") or []) + messages,
     }
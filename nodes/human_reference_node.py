@@ -2,8 +2,14 @@
 from langchain_core.messages import HumanMessage
 from pydantic import BaseModel
 from langchain.output_parsers import PydanticOutputParser
-from services.groq_service import chat_groq
+from services.groq_service import chat_groq_stream
 from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+import os
+import json
+import contextvars
+import traceback
+import httpx
 
 # -----------------------------
 # 1️⃣ Model JSON chuẩn cho output mỗi chuyên gia
@@ -33,65 +39,103 @@ EXPERTS = [
 ]
 
 # -----------------------------
-# 3️⃣ Node AI đa chuyên gia (trả về 1 JSON duy nhất)
+# 3️⃣ Cấu hình fan-out song song
 # -----------------------------
-def human_reference_node(state: Dict[str, Any]):
-    record = state.get("daily", {})
+EXPERT_MAX_WORKERS = int(os.getenv("EXPERT_MAX_WORKERS", "8"))    # số chuyên gia gọi đồng thời
+EXPERT_TIMEOUT = float(os.getenv("EXPERT_TIMEOUT", "90"))         # giây, timeout của từng lần gọi chuyên gia
+FALLBACK_TEXT = "Fallback"
+
+
+def _timeout_errors() -> tuple:
+    """Các lỗi timeout của 1 lần gọi: deadline của gateway, httpx và SDK Groq (nếu có)."""
+    errors = [TimeoutError, httpx.TimeoutException]
+    try:
+        from groq import APITimeoutError
+        errors.append(APITimeoutError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+TIMEOUT_ERRORS = _timeout_errors()
+
+
+def _build_prompt(expert: Dict[str, str], record: Dict[str, Any], parser: PydanticOutputParser) -> str:
     input_data = record.get("input", {})
     base_qua = record.get("base", {})
-    transformed_qua = record.get("transformed", {})
+    transformed_qua = record.get("transformed") or {}
     llm_summary = record.get("llm_summary", "")
 
-    final_result = {
-        "health": "",
-        "finance": "",
-        "psychology": "",
-        "work": "",
-        "trend": "",
-        "family": "",
-        "spiritual": "",
-        "community": ""
-    }
+    return (
+        f"Bạn là chuyên gia về lĩnh vực: {expert['field']}\n"
+        f"Dữ liệu đầu vào:\n"
+        f"- Thiên: {input_data.get('Thien','')}\n"
+        f"- Địa: {input_data.get('Dia','')}\n"
+        f"- Nhân: {input_data.get('Nhan','')}\n"
+        f"- Sự kiện nổi bật: {input_data.get('KeyEvent','')}\n"
+        f"- Tóm tắt LLM: {llm_summary}\n"
+        f"- Quẻ gốc: {base_qua.get('name','')}, bitstring: {base_qua.get('bitstring','')}\n"
+        f"- Quẻ biến: {transformed_qua.get('name','')}, bitstring: {transformed_qua.get('bitstring','')}\n"
+        f"- Quan hệ quẻ: Opposite, Transform, Ally, Support\n\n"
+        f"Hãy phân tích chuyên sâu lĩnh vực của bạn và trả về JSON đúng format:\n{parser.get_format_instructions()}"
+    )
+
+
+def _ask_expert(expert: Dict[str, str], record: Dict[str, Any]) -> str:
+    """
+    Gọi 1 chuyên gia, trả về nội dung của đúng key chuyên môn (hoặc Fallback nếu parse lỗi).
+    Stream response và ngắt ngay khi field của chuyên gia đã xong, không chờ 7 field còn lại.
+    Quá EXPERT_TIMEOUT thì gateway đóng stream (không chạy ngầm tốn rate limit) → Fallback.
+    """
+    parser = PydanticOutputParser(pydantic_object=ExpertOutput)
+    key = expert["key"]
+    try:
+        raw_result = chat_groq_stream(_build_prompt(expert, record, parser), required=(key,),
+                                      timeout=EXPERT_TIMEOUT)
+    except TIMEOUT_ERRORS:
+        print(f"⚠️ {expert['name']} quá {EXPERT_TIMEOUT}s, dùng Fallback")
+        return FALLBACK_TEXT
+    try:
+        value = json.loads(raw_result).get(key)
+    except Exception:
+        return FALLBACK_TEXT
+    return value if isinstance(value, str) and value else FALLBACK_TEXT
+
+
+# -----------------------------
+# 4️⃣ Node AI đa chuyên gia (trả về 1 JSON duy nhất)
+# -----------------------------
+def human_reference_node(state: Dict[str, Any]):
+    record = state.get("daily", {})
+
+    # Mặc định Fallback → chuyên gia nào lỗi/timeout vẫn giữ đủ 8 key
+    final_result = {expert["key"]: FALLBACK_TEXT for expert in EXPERTS}
 
-    for expert in EXPERTS:
-        parser = PydanticOutputParser(pydantic_object=ExpertOutput)
-
-        prompt = (
-            f"Bạn là chuyên gia về lĩnh vực: {expert['field']}\n"
-            f"Dữ liệu đầu vào:\n"
-            f"- Thiên: {input_data.get('Thien','')}\n"
-            f"- Địa: {input_data.get('Dia','')}\n"
-            f"- Nhân: {input_data.get('Nhan','')}\n"
-            f"- Sự kiện nổi bật: {input_data.get('KeyEvent','')}\n"
-            f"- Tóm tắt LLM: {llm_summary}\n"
-            f"- Quẻ gốc: {base_qua.get('name','')}, bitstring: {base_qua.get('bitstring','')}\n"
-            f"- Quẻ biến: {transformed_qua.get('name','')}, bitstring: {transformed_qua.get('bitstring','')}\n"
-            f"- Quan hệ quẻ: Opposite, Transform, Ally, Support\n\n"
-            f"Hãy phân tích chuyên sâu lĩnh vực của bạn và trả về JSON đúng format:\n{parser.get_format_instructions()}"
-        )
-
-        raw_result = chat_groq(prompt)
-
-        try:
-            result = parser.parse(raw_result)
-        except Exception:
-            result = ExpertOutput(
-                health="Fallback",
-                finance="Fallback",
-                psychology="Fallback",
-                work="Fallback",
-                trend="Fallback",
-                family="Fallback",
-                spiritual="Fallback",
-                community="Fallback"
-            )
-
-        # Gán nội dung chuyên môn chính vào JSON cuối cùng
-        key = expert["key"]
-        final_result[key] = getattr(result, key)
+    # Gửi 8 prompt cùng lúc, giới hạn số luồng đồng thời; mỗi lần gọi tự có timeout riêng
+    answered = 0
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(EXPERT_MAX_WORKERS, len(EXPERTS))),
+        thread_name_prefix="expert",
+    ) as executor:
+        # copy_context → LLM call của từng chuyên gia vẫn được tính vào metrics của node này
+        futures = {
+            executor.submit(contextvars.copy_context().run, _ask_expert, expert, record): expert
+            for expert in EXPERTS
+        }
+        for fut, expert in futures.items():
+            try:
+                final_result[expert["key"]] = fut.result()
+            except Exception:
+                traceback.print_exc()
+                print(f"⚠️ {expert['name']} lỗi, dùng Fallback")
+                continue
+            if final_result[expert["key"]] != FALLBACK_TEXT:
+                answered += 1
 
     print("📌 3 - human_reference_node_multi - ok", final_result)
-    msg = HumanMessage(content="human_reference_node_multi completed")
+    msg = HumanMessage(
+        content=f"human_reference_node_multi completed ({answered}/{len(EXPERTS)} chuyên gia)"
+    )
 
     return {
         "status": "done",
@@ -2,7 +2,8 @@
 from langchain_core.messages import HumanMessage
 from pydantic import BaseModel
 from langchain.output_parsers import PydanticOutputParser
-from services.groq_service import chat_groq  # Groq GPT
+from services.groq_service import chat_groq_stream  # Groq GPT (stream)
+from services.prompt_context import PROMPT_BUDGETS, build_context, fit_text, report_prompt
 from langchain_community.document_loaders import WebBaseLoader
 from typing import List, Dict
 
@@ -28,8 +29,9 @@ def research_node(state):
     # Parser JSON
     parser = PydanticOutputParser(pydantic_object=ResearchOutput)
 
-    # Tối giản prompt nhúng state
-    safe_state = {k: ("..." if k == "messages" else v) for k, v in state.items()}
+    # Chỉ nhúng field node cần + cắt nội dung web theo budget token
+    safe_state = build_context("research", state)
+    doc_text = fit_text(doc_text, PROMPT_BUDGETS["research_doc"])
     prompt = (
         f"Dữ liệu state: {safe_state}\n\n"
         f"Chủ đề: {topic}\n\n"
@@ -41,7 +43,13 @@ def research_node(state):
     )
 
     # Gọi Groq GPT, trả về string JSON
-    raw_result = chat_groq(prompt)
+    report_prompt("research", prompt)
+    raw_result = chat_groq_stream(
+        prompt,
+        required=ResearchOutput.model_fields,
+        on_field=lambda k, v: print(f"📥 research_node: xong field {k}"),
+        validate=parser.parse,  # parse lỗi → không lưu cache
+    )
     print("📌 raw_result from Groq:", raw_result)
 
     # Parse an toàn
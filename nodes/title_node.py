@@ -2,7 +2,8 @@
 from langchain_core.messages import HumanMessage
 from pydantic import BaseModel
 from langchain.output_parsers import PydanticOutputParser
-from services.groq_service import chat_groq  # hàm gọi Groq GPT-OSS-120B
+from services.groq_service import chat_groq_stream  # hàm gọi Groq GPT-OSS-120B (stream)
+from services.prompt_context import build_context, report_prompt
 
 # -----------------------------
 # 1️⃣ Model chuẩn để parse JSON
@@ -17,12 +18,17 @@ class TitleOutput(BaseModel):
 def title_node(state):
     topic = state.get("topic", "Demo")
     outputs = state.get("outputs", {})
-    ideas = outputs.get("ideas", []) if isinstance(outputs, dict) else []
+    # kết quả idea_node nằm ở outputs.idea (xem PROMPT_FIELDS["title"]), dạng {nhóm: [ý tưởng]}
+    idea = outputs.get("idea") if isinstance(outputs, dict) else None
+    if isinstance(idea, dict):
+        ideas = [str(i) for v in idea.values() if isinstance(v, list) for i in v]
+    else:
+        ideas = [str(i) for i in (idea or [])]
 
     parser = PydanticOutputParser(pydantic_object=TitleOutput)
 
-    # Tối giản prompt, nhúng state nhưng ẩn messages
-    safe_state = {k: ("..." if k == "messages" else v) for k, v in state.items()}
+    # Chỉ nhúng field node cần (topic, keyword, idea), cắt theo budget token
+    safe_state = build_context("title", state)
     prompt = (
         f"Dữ liệu state: {safe_state}\n\n"
         f"Chủ đề: {topic}\n"
@@ -32,8 +38,9 @@ def title_node(state):
         f"Trả về đúng JSON theo format:\n{parser.get_format_instructions()}"
     )
 
-    # Gọi Groq, luôn trả về string
-    raw_result = chat_groq(prompt)
+    # Gọi Groq (stream), dừng khi đã đủ text + description
+    report_prompt("title", prompt)
+    raw_result = chat_groq_stream(prompt, required=TitleOutput.model_fields, validate=parser.parse)
     print("📌 raw_result from Groq:", raw_result)
 
     try:
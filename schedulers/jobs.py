@@ -1,11 +1,11 @@
 import logging
-from services.notion_service import NotionService
+from services.registry import lazy
 
 logger = logging.getLogger("jobs")
 logging.basicConfig(level=logging.INFO)
 
-# Tạo client Notion
-notion = NotionService()
+# Client Notion dùng chung, tạo lazy ở lần dùng đầu
+notion = lazy("notion")
 
 
 async def task_ping():
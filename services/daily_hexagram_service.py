@@ -2,6 +2,7 @@
 import os
 import json
 import time
+import threading
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from services.llm_service import llm
@@ -115,7 +116,9 @@ Choose scores consistent with inputs. Keep JSON compact.
                     data = json.loads(resp_text[start:end+1])
                     return data
                 except Exception as e:
+                    llm.forget(prompt)  # không để lần retry nhận lại đúng response lỗi từ cache
                     raise ValueError(f"LLM returned non-JSON response. Raw:\n{resp_text}") from e
+            llm.forget(prompt)
             raise ValueError(f"LLM returned non-JSON response. Raw:\n{resp_text}")
 
     def create_daily_node(self, tien: str, dia: str, nhan: str, key_event: str, node_id: Optional[str]=None) -> Dict[str, Any]:
@@ -151,31 +154,30 @@ Choose scores consistent with inputs. Keep JSON compact.
             transformed_bits_h1_h6 = flipped
             transformed_bitstr = build_bitstring_from_h1_to_h6(flipped)
 
-        # 4) lookup ids & names
-        hex_bs = self.hex_svc.bitstrings  # list of 64 bitstrings in service
-        if base_bitstr in hex_bs:
-            base_idx = hex_bs.index(base_bitstr)
-            base_node = self.hex_svc.get_node(base_idx)
-        else:
+        # 4) lookup ids & names (dict index, không scan list)
+        base_idx = self.hex_svc.find_by_bitstring(base_bitstr)
+        if base_idx is None:
             raise ValueError("Base bitstring not found in hexagram service")
+        base_node = self.hex_svc.get_node(base_idx)
 
         transformed_node = None
+        tidx = None
         if transformed_bitstr:
-            if transformed_bitstr in hex_bs:
-                tidx = hex_bs.index(transformed_bitstr)
+            tidx = self.hex_svc.find_by_bitstring(transformed_bitstr)
+            if tidx is not None:
                 transformed_node = self.hex_svc.get_node(tidx)
             else:
                 transformed_node = {"note":"transformed bitstring not found", "bits": transformed_bitstr}
 
-        # 5) get relations (detailed and compact)
-        base_relations = self.hex_svc.relations_of(base_node["name"])
-        base_relations_compact = self.hex_svc.relations_compact(base_node["name"])
+        # 5) get relations (detailed and compact) theo id, có cache
+        base_relations = self.hex_svc.relations_by_id(base_idx)
+        base_relations_compact = self.hex_svc.relations_compact_by_id(base_idx)
 
         transformed_relations = None
         transformed_relations_compact = None
-        if transformed_node and "id" in transformed_node:
-            transformed_relations = self.hex_svc.relations_of(transformed_node["name"])
-            transformed_relations_compact = self.hex_svc.relations_compact(transformed_node["name"])
+        if tidx is not None:
+            transformed_relations = self.hex_svc.relations_by_id(tidx)
+            transformed_relations_compact = self.hex_svc.relations_compact_by_id(tidx)
 
         # 6) assemble node
         node = {
@@ -214,3 +216,22 @@ Choose scores consistent with inputs. Keep JSON compact.
         return node
 
 
+# ---------- Shared instance ----------
+_shared_service: Optional[DailyHexagramService] = None
+_shared_lock = threading.Lock()
+
+
+def get_daily_hexagram_service() -> DailyHexagramService:
+    """
+    Lazily create one DailyHexagramService per process (thread-safe).
+    The HexagramService behind it is warmed once, so repeated workflow runs
+    reuse the same relation cache instead of rebuilding it.
+    """
+    global _shared_service
+    if _shared_service is None:
+        with _shared_lock:
+            if _shared_service is None:
+                hex_svc = HexagramService()
+                hex_svc.warm()
+                _shared_service = DailyHexagramService(hex_svc)
+    return _shared_service
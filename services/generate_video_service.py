@@ -1,10 +1,27 @@
 # improved_quote_video.py
 from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageFilter, ImageOps
 import math
+import functools
 import numpy as np
-from moviepy import ImageSequenceClip
 import os
 import sys
+import queue
+import tempfile
+import threading
+import subprocess
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Render song song: 1 (mặc định) = tuần tự trong process hiện tại, 0 = theo số core, N = N process
+VIDEO_RENDER_WORKERS = int(os.getenv("VIDEO_RENDER_WORKERS", "1"))
+VIDEO_RENDER_CHUNK = int(os.getenv("VIDEO_RENDER_CHUNK", "4"))   # số frame mỗi task gửi sang worker
+
+# Bank texture grain dựng sẵn (dùng chung giữa các video cùng độ phân giải)
+GRAIN_BANK_SIZE = int(os.getenv("GRAIN_BANK_SIZE", "8"))    # số tile, xoay vòng theo frame
+GRAIN_BANK_SEED = int(os.getenv("GRAIN_BANK_SEED", "0"))
+GRAIN_BANK_PAD = 32                                         # tile rộng hơn frame → cắt lệch ngẫu nhiên mỗi frame
 
 # --------- Utils / Easing ----------
 def ease_out_cubic(t):
@@ -16,7 +33,8 @@ def smoothstep(t):
 def sinus_ease(t):
     return math.sin(t * math.pi / 2)
 
-# safe font loader with fallback
+# safe font loader with fallback (cache theo path + size, dùng lại giữa các video)
+@functools.lru_cache(maxsize=32)
 def load_font(path, size):
     try:
         return ImageFont.truetype(path, size)
@@ -59,11 +77,60 @@ def vignette_mask(size, strength=0.6, center_radius=0.77):
     return mask_img.filter(ImageFilter.GaussianBlur(radius=min(width,height)*0.03))
 
 # film grain overlay
-def film_grain(size, amount=0.03):
+def grain_noise(size, amount=0.03, rng=None):
+    """Nhiễu xám uint8 (H, W) quanh 127."""
     width, height = size if isinstance(size, tuple) else (size, size)
-    noise = (np.random.randn(height, width) * 255 * amount + 127).clip(0,255).astype(np.uint8)
+    randn = rng.standard_normal if rng is not None else np.random.standard_normal
+    return (randn((height, width)) * 255 * amount + 127).clip(0,255).astype(np.uint8)
+
+@functools.lru_cache(maxsize=4)
+def grain_bank(size, amount=0.03, seed=GRAIN_BANK_SEED, count=GRAIN_BANK_SIZE):
+    """count tile nhiễu (H+PAD, W+PAD, 1) uint8, sinh 1 lần cho mỗi (size, amount, seed, count)."""
+    width, height = size if isinstance(size, tuple) else (size, size)
+    rng = np.random.default_rng(seed)
+    bank = np.stack([grain_noise((width + GRAIN_BANK_PAD, height + GRAIN_BANK_PAD), amount, rng)
+                     for _ in range(count)])[..., None]
+    bank.setflags(write=False)
+    return bank
+
+def grain_tile(size, frame_index, amount=0.03, rng=None):
+    """Grain cho 1 frame: tile thứ frame_index % count, cắt ở offset ngẫu nhiên → vẫn 'sống' giữa các frame."""
+    width, height = size if isinstance(size, tuple) else (size, size)
+    bank = grain_bank((width, height), amount)
+    if rng is not None:
+        ox, oy = rng.integers(0, GRAIN_BANK_PAD + 1, size=2)
+    else:
+        ox, oy = np.random.randint(0, GRAIN_BANK_PAD + 1, size=2)
+    return bank[frame_index % len(bank), oy:oy+height, ox:ox+width]
+
+def film_grain(size, amount=0.03, rng=None):
+    width, height = size if isinstance(size, tuple) else (size, size)
+    noise = grain_noise((width, height), amount, rng)
     return Image.fromarray(noise, mode="L").convert("RGBA").resize((width,height))
 
+# --------- NumPy compositing (blend in-place vào buffer float32 RGB) ----------
+def glyph_mask(text, font):
+    """Rasterize text 1 lần → (dx, dy, alpha float32 0..1) cắt sát bbox; dx/dy là offset so với điểm vẽ."""
+    left, top, right, bottom = font.getbbox(text)
+    if right <= left or bottom <= top:
+        return left, top, np.zeros((0, 0), np.float32)
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+    return left, top, np.asarray(mask, dtype=np.float32) / 255.0
+
+def blend_mask(buf, mask, x, y, color, alpha):
+    """buf[y:, x:] ← color với alpha = mask * alpha, chỉ trên vùng bbox của mask (tự cắt theo biên frame)."""
+    if alpha <= 0 or mask.size == 0:
+        return
+    h, w = mask.shape
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, buf.shape[1]), min(y + h, buf.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return
+    a = mask[y0-y:y1-y, x0-x:x1-x, None] * alpha
+    region = buf[y0:y1, x0:x1]
+    region += (np.asarray(color, dtype=np.float32) - region) * a
+
 # rounded rectangle mask
 def rounded_rect_mask(size, rect, radius):
     width, height = size if isinstance(size, tuple) else (size, size)
@@ -72,6 +139,85 @@ def rounded_rect_mask(size, rect, radius):
     draw.rounded_rectangle(rect, radius=radius, fill=255)
     return mask.filter(ImageFilter.GaussianBlur(radius=radius*0.5))
 
+# Lấy màu trung bình nền video
+def average_color(img):
+    # resize nhỏ để tính nhanh
+    small = img.resize((16,16))
+    arr = np.array(small)
+    avg = arr.mean(axis=(0,1))
+    return tuple(int(c) for c in avg)
+
+# --------- Render plan (phần bất biến giữa các frame) ----------
+class RenderPlan:
+    """
+    Tính 1 lần cho cả video những thứ không đổi theo frame: font, wrap dòng + độ rộng,
+    vị trí plaque/text/author, oval mask của plaque và alpha mask của vignette.
+    generate_frame chỉ còn làm phần biến đổi theo frame (zoom/pan, alpha, slide...).
+    """
+
+    def __init__(self, text, author=None, size=512,
+                 font_quote_path="asset/fonts/NotoSerif-Medium.ttf",
+                 font_author_path="asset/fonts/PlaywriteDESAS-Light.ttf",
+                 vignette_strength=0.7,
+                 vignette_alpha_scale=0.8):
+        width, height = size if isinstance(size, tuple) else (size, size)
+        self.size = (width, height)
+        self.width, self.height = width, height
+        self.text = text
+        self.author = author
+
+        self.padding = int(width * 0.12)
+        self.max_width = width - 2*self.padding
+
+        self.quote_font_size = max(20, int(width * 0.072))
+        self.author_font_size = max(14, int(width * 0.044))
+        self.font_quote = load_font(font_quote_path, self.quote_font_size)
+        self.font_author = load_font(font_author_path, self.author_font_size)
+
+        # layout dòng chữ (đo bằng draw trên ảnh 1x1, không cần frame thật)
+        measure = ImageDraw.Draw(Image.new("L", (1, 1)))
+        self.lines = wrap_text(measure, text, self.font_quote, self.max_width)
+        self.line_widths = [measure.textbbox((0,0), line, font=self.font_quote)[2] for line in self.lines]
+        self.line_height = int(self.quote_font_size * 1.25)
+        self.total_text_h = len(self.lines) * self.line_height
+
+        # plaque behind text
+        author_block = self.author_font_size + 10 if author else 0
+        self.plaque_padding_x = int(self.padding * 0.6)
+        self.plaque_padding_y = int(self.padding * 0.4)
+        self.plaque_w = self.max_width + self.plaque_padding_x * 2
+        self.plaque_h = self.total_text_h + self.plaque_padding_y * 2 + author_block
+        self.plaque_x = (width - self.plaque_w) // 2
+        self.plaque_y = (height - self.plaque_h) // 2
+
+        self.x_center = width // 2
+        self.y_start = self.plaque_y + self.plaque_padding_y + int(
+            (self.plaque_h - self.plaque_padding_y*2 - author_block - self.total_text_h) / 2)
+
+        # author
+        self.author_text = f"— {author}" if author else None
+        self.author_width = measure.textbbox((0,0), self.author_text, font=self.font_author)[2] if author else 0
+        self.author_y = self.plaque_y + self.plaque_h - self.plaque_padding_y - self.author_font_size
+
+        # --- oval đứng của plaque, rộng = plaque_w, cao = plaque_h, viền làm mềm bằng blur ---
+        oval_mask = Image.new("L", self.size, 0)
+        od = ImageDraw.Draw(oval_mask)
+        od.ellipse((self.plaque_x, self.plaque_y, self.plaque_x+self.plaque_w, self.plaque_y+self.plaque_h), fill=255)
+        self.oval_mask = oval_mask.filter(ImageFilter.GaussianBlur(radius=width*0.015))
+        # chỉ giữ phần bbox khác 0 của oval (plaque chỉ blend trong vùng này)
+        ox0, oy0, ox1, oy1 = self.oval_mask.getbbox() or (0, 0, 0, 0)
+        self.oval_origin = (ox0, oy0)
+        self.oval_alpha = np.asarray(self.oval_mask.crop((ox0, oy0, ox1, oy1)), dtype=np.float32) / 255.0
+
+        # --- vignette: invert + scale alpha (0.0 = trong suốt hoàn toàn, 1.0 = full) ---
+        vmask = ImageOps.invert(vignette_mask(self.size, strength=vignette_strength))
+        self.vignette_alpha = vmask.point(lambda p: int(p * vignette_alpha_scale))
+        self.vignette_a = np.asarray(self.vignette_alpha, dtype=np.float32)[:, :, None] / 255.0
+
+        # --- glyph mask từng dòng + author, rasterize 1 lần; shadow dùng lại mask, lệch (2,2) ---
+        self.line_masks = [glyph_mask(line, self.font_quote) for line in self.lines]
+        self.author_mask = glyph_mask(self.author_text, self.font_author) if author else None
+
 # --------- Frame generator ----------
 def generate_frame(pil_image, text, author=None, size=512,
                    frame_index=0, total_frames=200,
@@ -81,9 +227,14 @@ def generate_frame(pil_image, text, author=None, size=512,
                    font_author_path="asset/fonts/PlaywriteDESAS-Light.ttf",
                    motion_trail=0.12,
                    grain_amount=0.03,
-                   bg_dof_max=1.8):
-
-    width, height = size if isinstance(size, tuple) else (size, size)
+                   bg_dof_max=1.8,
+                   plan=None,
+                   rng=None):
+
+    # plan dựng sẵn 1 lần cho cả video; gọi lẻ thì tự dựng
+    if plan is None:
+        plan = RenderPlan(text, author, size, font_quote_path, font_author_path)
+    width, height = plan.size
     progress = frame_index / max(1, total_frames - 1)
     t_smooth = ease_out_cubic(progress)
     t_sin = sinus_ease(progress)
@@ -107,117 +258,210 @@ def generate_frame(pil_image, text, author=None, size=512,
     base = ImageEnhance.Brightness(base).enhance(1.02)
     base = ImageEnhance.Sharpness(base).enhance(0.95)
 
-    frame = base.convert("RGBA")
-
-    draw = ImageDraw.Draw(frame)
-    padding = int(width * 0.12)
-    max_width = width - 2*padding
-
-    quote_font_size = max(20, int(width * 0.072))
-    author_font_size = max(14, int(width * 0.044))
-
-    font_quote = load_font(font_quote_path, quote_font_size)
-    font_author = load_font(font_author_path, author_font_size)
-
-    tmp_draw = ImageDraw.Draw(frame)
-    lines = wrap_text(tmp_draw, text, font_quote, max_width)
-
-    line_height = int(quote_font_size * 1.25)
-    total_text_h = len(lines) * line_height
-
-    # plaque behind text
-    plaque_padding_x = int(padding * 0.6)
-    plaque_padding_y = int(padding * 0.4)
-    plaque_w = max_width + plaque_padding_x * 2
-    plaque_h = total_text_h + plaque_padding_y * 2 + (author_font_size + 10 if author else 0)
-    plaque_x = (width - plaque_w) // 2
-    plaque_y = (height - plaque_h) // 2
-
-    # --- tạo plaque oval đứng ---
-    plaque_layer = Image.new("RGBA", (width, height), (0,0,0,0))
-    oval_mask = Image.new("L", (width, height), 0)
-    od = ImageDraw.Draw(oval_mask)
-    # tạo oval đứng, rộng = plaque_w, cao = plaque_h
-    od.ellipse((plaque_x, plaque_y, plaque_x+plaque_w, plaque_y+plaque_h), fill=255)
-    # làm mềm viền bằng blur
-    oval_mask = oval_mask.filter(ImageFilter.GaussianBlur(radius=width*0.015))
-
-    # layer màu tối, alpha vừa phải để mờ
-    dark = Image.new("RGBA", (width, height), (10,10,10,int(40 * t_smooth)))  # giảm alpha để mờ
-    plaque_layer = Image.composite(dark, plaque_layer, oval_mask)
-
-    # ghép vào frame
-    frame = Image.alpha_composite(frame, plaque_layer)
-
-
+    # frame buffer float32 RGB, mọi layer blend in-place vào đây (không dựng layer RGBA full-frame)
+    buf = np.asarray(base, dtype=np.float32).copy()
 
+    # --- plaque oval (mask dựng sẵn), màu tối, alpha vừa phải để mờ ---
+    ox, oy = plan.oval_origin
+    blend_mask(buf, plan.oval_alpha, ox, oy, (10,10,10), int(40 * t_smooth) / 255.0)
 
     # text with shadow
     text_progress = smoothstep(min(1.0, progress * 2.2))
     text_alpha = int(255 * text_opacity * text_progress)
     shadow_alpha = int(text_alpha * 0.25)
 
-    x_center = width // 2
-    y_start = plaque_y + plaque_padding_y + int((plaque_h - plaque_padding_y*2 - (author_font_size+10 if author else 0) - total_text_h) / 2)
-
-    for i, line in enumerate(lines):
+    for i, line in enumerate(plan.lines):
         line_t = min(1.0, max(0.0, (progress * 2.5) - i*0.01))
         line_e = ease_out_cubic(line_t)
-        w = draw.textbbox((0,0), line, font=font_quote)[2]
-        x = x_center - w // 2
-        y = int(y_start + i * line_height - (1 - line_e) * (height * 0.03))
+        x = plan.x_center - plan.line_widths[i] // 2
+        y = int(plan.y_start + i * plan.line_height - (1 - line_e) * (height * 0.03))
         slide = int((1 - line_e) * width * 0.02)
 
-        shadow = Image.new("RGBA", frame.size, (0,0,0,0))
-        sd = ImageDraw.Draw(shadow)
-        sd.text((x+slide+2, y+2), line, font=font_quote, fill=(0,0,0,shadow_alpha))
-        frame = Image.alpha_composite(frame, shadow)
-
-        txt = Image.new("RGBA", frame.size, (0,0,0,0))
-        td = ImageDraw.Draw(txt)
-        td.text((x+slide, y), line, font=font_quote, fill=(255,255,255,text_alpha))
-        frame = Image.alpha_composite(frame, txt)
+        dx, dy, mask = plan.line_masks[i]
+        blend_mask(buf, mask, x+slide+2+dx, y+2+dy, (0,0,0), shadow_alpha / 255.0)
+        blend_mask(buf, mask, x+slide+dx, y+dy, (255,255,255), text_alpha / 255.0)
 
     # author
-    if author:
-        author_text = f"— {author}"
-        w = draw.textbbox((0,0), author_text, font=font_author)[2]
-        ay = plaque_y + plaque_h - plaque_padding_y - author_font_size
+    if plan.author_text:
         a_t = smoothstep(min(1.0, (progress - 0.1) * 3.0))
         a_alpha = int(220 * a_t)
         a_slide = int((1 - a_t) * width * 0.015)
-        author_layer = Image.new("RGBA", frame.size, (0,0,0,0))
-        ad = ImageDraw.Draw(author_layer)
-        ad.text(((width - w)//2 + a_slide, ay), author_text, font=font_author, fill=(230,230,230,a_alpha))
-        frame = Image.alpha_composite(frame, author_layer)
-
-    # Lấy màu trung bình nền video
-    def average_color(img):
-        # resize nhỏ để tính nhanh
-        small = img.resize((16,16))
-        arr = np.array(small)
-        avg = arr.mean(axis=(0,1))
-        return tuple(int(c) for c in avg)
-
-    # --------- trong generate_frame, thay cho vignette cũ ---------
-    vmask = vignette_mask(size, strength=0.7)
-    vmask = ImageOps.invert(vmask)
-    
-    alpha_scale = 0.8  # 0.0 = trong suốt hoàn toàn, 1.0 = full
-    # scale mask để giảm bóng
-    vmask = vmask.point(lambda p: int(p * alpha_scale))
-
-    avg_color = average_color(base)  # lấy màu từ background đã blur/color grade
-    color_layer = Image.new("RGBA", frame.size, avg_color + (180,))  # thêm alpha
-    color_layer.putalpha(vmask)
-    frame = Image.alpha_composite(frame, color_layer)
-
-    # film grain
-    grain = film_grain(size, amount=grain_amount)
-    grain.putalpha(int(38 * 0.9))
-    frame = Image.alpha_composite(frame, grain)
-
-    return frame
+        dx, dy, mask = plan.author_mask
+        blend_mask(buf, mask, (width - plan.author_width)//2 + a_slide + dx, plan.author_y + dy,
+                   (230,230,230), a_alpha / 255.0)
+
+    # vignette màu trung bình nền (mask dựng sẵn), màu lấy từ background đã blur/color grade
+    avg_color = np.asarray(average_color(base), dtype=np.float32)
+    buf += (avg_color - buf) * plan.vignette_a
+
+    # film grain (xám, alpha cố định) lấy từ bank dựng sẵn
+    grain = grain_tile(plan.size, frame_index, amount=grain_amount, rng=rng)
+    buf += (grain - buf) * (int(38 * 0.9) / 255.0)
+
+    np.clip(buf + 0.5, 0, 255, out=buf)
+    return Image.fromarray(buf.astype(np.uint8))
+
+# --------- Streaming encoder ----------
+def ffmpeg_exe():
+    """ffmpeg đi kèm imageio[ffmpeg] nếu có, không thì lấy từ FFMPEG_BINARY / PATH."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+
+class FFmpegWriter:
+    """
+    Đẩy từng frame RGB thẳng vào ffmpeg qua stdin (rawvideo), không giữ list frame trong RAM.
+    Thread riêng ghi pipe + queue giới hạn → render frame sau trong lúc ffmpeg encode frame trước,
+    bộ nhớ cố định (~queue_size frame).
+    """
+
+    def __init__(self, output, size, fps=30, codec="libx264", preset="slow", crf=18, queue_size=8):
+        self.width, self.height = size
+        self.output = output
+        cmd = [
+            ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-vcodec", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{self.width}x{self.height}", "-r", str(fps), "-i", "-",
+            "-an", "-c:v", codec, "-preset", preset, "-crf", str(crf),
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",  # yuv420p cần kích thước chẵn
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            output,
+        ]
+        # stderr ra file tạm: ffmpeg log nhiều cũng không làm nghẽn pipe
+        self._stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=self._stderr)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._pump, name="ffmpeg-writer", daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if self._error is not None:
+                continue  # ffmpeg đã lỗi: chỉ rút queue để write() không bị treo
+            try:
+                self.proc.stdin.write(data)
+            except Exception as e:
+                self._error = e
+
+    def write(self, frame):
+        """frame: PIL Image hoặc mảng uint8 (H, W, 3)."""
+        if self._error is not None:
+            raise RuntimeError(f"ffmpeg dừng giữa chừng: {self._stderr_text() or self._error}")
+        if isinstance(frame, Image.Image):
+            data = frame.convert("RGB").tobytes()
+        else:
+            data = np.ascontiguousarray(frame, dtype=np.uint8).tobytes()
+        self._queue.put(data)
+
+    def _stderr_text(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode("utf-8", "ignore").strip()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self.proc.stdin.close()
+        except Exception:
+            pass
+        code = self.proc.wait()
+        err = self._stderr_text()
+        self._stderr.close()
+        if code != 0 or self._error is not None:
+            raise RuntimeError(f"ffmpeg lỗi (exit {code}): {err or self._error}")
+
+    def abort(self):
+        self.proc.kill()
+        self._queue.put(None)
+        self._thread.join()
+        self.proc.wait()
+        self._stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# --------- Parallel render (process pool) ----------
+_worker = {}
+
+def _frame_rng(seed, frame_index):
+    # grain theo (seed, frame) → tuần tự hay song song đều ra cùng 1 video
+    return np.random.default_rng([seed, frame_index])
+
+def _init_render_worker(shm_name, shape, text, author, size, total_frames, seed):
+    # nền đã chuẩn bị được gửi 1 lần qua shared memory, không pickle theo từng task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        _worker["pil"] = Image.fromarray(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy())
+    finally:
+        shm.close()
+    _worker["plan"] = RenderPlan(text, author, size)
+    _worker["args"] = (text, author, size, total_frames, seed)
+
+def _render_chunk(start, stop):
+    """Render frame [start, stop) trong worker, trả list mảng RGB uint8 (chưa blend trail)."""
+    text, author, size, total_frames, seed = _worker["args"]
+    out = []
+    for i in range(start, stop):
+        f = generate_frame(_worker["pil"], text, author, size=size, frame_index=i,
+                           total_frames=total_frames, plan=_worker["plan"], rng=_frame_rng(seed, i))
+        out.append(np.asarray(f.convert("RGB")))
+    return out
+
+def _render_parallel(pil, text, author, size, total_frames, seed, workers, chunk):
+    """
+    Chia dải frame thành chunk cho process pool, yield frame RGB đúng thứ tự.
+    Chỉ giữ tối đa workers*2 chunk đang chạy/chờ (cửa sổ trượt) → bộ nhớ không phụ thuộc độ dài video.
+    """
+    arr = np.asarray(pil.convert("RGB"))
+    shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+    try:
+        np.ndarray(arr.shape, dtype=np.uint8, buffer=shm.buf)[:] = arr
+        initargs = (shm.name, arr.shape, text, author, size, total_frames, seed)
+        # spawn: process cha là server nhiều thread, fork giữa lúc thread khác giữ lock dễ treo;
+        # worker chỉ cần PIL + numpy nên khởi động spawn rẻ
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_render_worker, initargs=initargs) as pool:
+            starts = iter(range(0, total_frames, chunk))
+            pending = deque()
+
+            def submit_next():
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(pool.submit(_render_chunk, start, min(start + chunk, total_frames)))
+
+            try:
+                for _ in range(workers * 2):
+                    submit_next()
+                while pending:
+                    frames = pending.popleft().result()
+                    submit_next()
+                    yield from frames
+            finally:
+                # dừng giữa chừng (generator bị close) → huỷ các chunk chưa chạy
+                for fut in pending:
+                    fut.cancel()
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _render_serial(pil, text, author, size, total_frames, seed, plan):
+    for i in range(total_frames):
+        f = generate_frame(pil, text, author, size=size, frame_index=i, total_frames=total_frames,
+                           plan=plan, rng=_frame_rng(seed, i))
+        yield np.asarray(f.convert("RGB"))
 
 # --------- Video generation ----------
 def generate_video(img_path, text, author=None,
@@ -228,7 +472,9 @@ def generate_video(img_path, text, author=None,
                    codec="libx264",
                    preset="slow",
                    crf=18,
-                   temp_preview=False):
+                   temp_preview=False,
+                   workers=None,
+                   seed=None):
 
     pil = Image.open(img_path).convert("RGB")
     if isinstance(size, int):
@@ -243,20 +489,40 @@ def generate_video(img_path, text, author=None,
     top = (target_h - height) // 2
     pil = pil.crop((left, top, left + width, top + height))
 
-    frames = []
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2**32))
+    if workers is None:
+        workers = VIDEO_RENDER_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(1, total_frames // VIDEO_RENDER_CHUNK))
+
+    if workers > 1:
+        print(f"Render song song: {workers} process")
+        frames = _render_parallel(pil, text, author, size, total_frames, seed, workers, VIDEO_RENDER_CHUNK)
+    else:
+        # phần bất biến (font, layout, mask) dựng 1 lần cho cả video
+        plan = RenderPlan(text, author, size)
+        frames = _render_serial(pil, text, author, size, total_frames, seed, plan)
+
+    # trail blend phụ thuộc frame trước đã blend → làm tuần tự ở đây, theo đúng thứ tự frame,
+    # rồi đẩy luôn vào ffmpeg (không giữ cả video trong RAM)
     prev_frame = None
     print("Generating frames:")
-    for i in range(total_frames):
-        f = generate_frame(pil, text, author, size=size, frame_index=i, total_frames=total_frames)
-        if prev_frame is not None:
-            f = Image.blend(f, prev_frame, alpha=0.12)
-        prev_frame = f.copy()
-        frames.append(np.array(f.convert("RGB")))
-        if (i+1) % 20 == 0 or i == total_frames-1:
-            print(f"  {i+1}/{total_frames} frames done")
-
-    clip = ImageSequenceClip(frames, fps=fps)
-    clip.write_videofile(output, codec=codec, preset=preset, ffmpeg_params=["-crf", str(crf)])
+    try:
+        with FFmpegWriter(output, size, fps=fps, codec=codec, preset=preset, crf=crf) as writer:
+            for i, arr in enumerate(frames):
+                f = Image.fromarray(arr)
+                if prev_frame is not None:
+                    f = Image.blend(f, prev_frame, alpha=0.12)
+                prev_frame = f
+                writer.write(f)
+                if (i+1) % 20 == 0 or i == total_frames-1:
+                    print(f"  {i+1}/{total_frames} frames done")
+    finally:
+        # ffmpeg lỗi giữa chừng → đóng generator ngay để giải phóng process pool + shared memory
+        frames.close()
+
     print(f"Đã xuất video: {output}")
 
 # --------- CLI ----------
@@ -1,28 +1,43 @@
-import os
-from dotenv import load_dotenv
-from groq import Groq
+from typing import Any, Callable, Iterable, Optional
 
-load_dotenv()
-groq_api_key = os.environ.get("GROQ_API_KEY")
-if not groq_api_key:
-    raise ValueError("Thiếu GROQ_API_KEY trong file .env")
+from services.llm_gateway import achat, astream_json, chat, stream_json
 
-client = Groq(api_key=groq_api_key)
 
-def chat_groq(prompt: str, model: str = "openai/gpt-oss-120b", temperature: float = 0.7):
+def chat_groq(prompt: str, model: str = "openai/gpt-oss-120b", temperature: float = 0.7,
+              validate: Optional[Callable[[str], Any]] = None):
     """
     Gọi Groq GPT-OSS-120B và trả về toàn bộ kết quả JSON string một lần.
     Không dùng generator nữa.
+    Đi qua services/llm_gateway.py: cache, rate limit, retry 429/5xx, gộp prompt trùng.
     """
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_completion_tokens=8192,
-        top_p=1,
-        reasoning_effort="medium",
-        stream=False,  # Luôn False để trả về 1 lần
-    )
-
-    # Trả về string hoàn chỉnh (JSON/Plain text)
-    return completion.choices[0].message.content
+    return chat(prompt, provider="groq", model=model, temperature=temperature, validate=validate)
+
+
+async def achat_groq(prompt: str, model: str = "openai/gpt-oss-120b", temperature: float = 0.7,
+                     validate: Optional[Callable[[str], Any]] = None):
+    """Bản async của chat_groq."""
+    return await achat(prompt, provider="groq", model=model, temperature=temperature, validate=validate)
+
+
+def chat_groq_stream(prompt: str, required: Iterable[str] = (),
+                     on_field: Optional[Callable[[str, Any], None]] = None,
+                     model: str = "openai/gpt-oss-120b", temperature: float = 0.7,
+                     timeout: Optional[float] = None, validate: Optional[Callable[[str], Any]] = None):
+    """
+    Như chat_groq nhưng stream: on_field(key, value) chạy ngay khi 1 field JSON xong,
+    dừng sinh token khi đã đủ field required. Trả về JSON string.
+    timeout (giây): quá hạn thì đóng stream và raise TimeoutError.
+    validate (vd parser.parse): raise → response không được lưu cache.
+    """
+    return stream_json(prompt, required, on_field, provider="groq", model=model, temperature=temperature,
+                       timeout=timeout, validate=validate)
+
+
+async def achat_groq_stream(prompt: str, required: Iterable[str] = (),
+                            on_field: Optional[Callable[[str, Any], None]] = None,
+                            model: str = "openai/gpt-oss-120b", temperature: float = 0.7,
+                            timeout: Optional[float] = None,
+                            validate: Optional[Callable[[str], Any]] = None):
+    """Bản async của chat_groq_stream."""
+    return await astream_json(prompt, required, on_field, provider="groq", model=model,
+                              temperature=temperature, timeout=timeout, validate=validate)
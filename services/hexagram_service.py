@@ -1,136 +1,269 @@
 # services/hexagram_service.py
-import networkx as nx
 from typing import Optional, Tuple, Dict, Any, List
+import copy
+import hashlib
 import json
+import os
+import pickle
+
+# King-Wen order names (Chinese, pinyin, English). Index 0 -> hexagram 1.
+DEFAULT_HEXAGRAM_NAMES: Tuple[str, ...] = (
+    "乾 Qián - The Creative",
+    "坤 Kūn - The Receptive",
+    "屯 Zhūn - Difficulty at the Beginning",
+    "蒙 Méng - Youthful Folly",
+    "需 Xū - Waiting (Attending)",
+    "訟 Sòng - Conflict",
+    "師 Shī - The Army",
+    "比 Bǐ - Holding Together",
+    "小畜 Xiǎo Xù - Taming the Power of the Small",
+    "履 Lǚ - Treading (Conduct)",
+    "泰 Tài - Peace",
+    "否 Pǐ - Standstill (Stagnation)",
+    "同人 Tóng Rén - Fellowship with Men",
+    "大有 Dà Yǒu - Possession in Great Measure",
+    "謙 Qiān - Modesty",
+    "豫 Yù - Enthusiasm",
+    "隨 Suí - Following",
+    "蠱 Gǔ - Work on the Decayed",
+    "臨 Lín - Approach",
+    "觀 Guān - Contemplation (Viewing)",
+    "噬嗑 Shì Kè - Biting Through",
+    "賁 Bì - Grace (Adorning)",
+    "剝 Bō - Splitting Apart",
+    "復 Fù - Return (Turning Back)",
+    "無妄 Wú Wàng - Innocence (The Unexpected)",
+    "大畜 Dà Xù - Great Taming",
+    "頤 Yí - Corners of the Mouth (Nourishment)",
+    "大過 Dà Guò - Preponderance of the Great",
+    "坎 Kǎn - The Abysmal (Water)",
+    "離 Lí - The Clinging (Fire)",
+    "咸 Xián - Influence (Conjoining)",
+    "恒 Héng - Duration",
+    "遯 Dùn - Retreat",
+    "大壯 Dà Zhuàng - Great Power",
+    "晉 Jìn - Progress (Advancement)",
+    "明夷 Míng Yí - Darkening of the Light",
+    "家人 Jiā Rén - The Family",
+    "睽 Kuí - Opposition",
+    "蹇 Jiǎn - Obstruction (Difficulty)",
+    "解 Xiè - Deliverance",
+    "損 Sǔn - Decrease",
+    "益 Yì - Increase",
+    "夬 Guài - Breakthrough (Resolution)",
+    "姤 Gòu - Coming to Meet",
+    "萃 Cuì - Gathering Together (Massing)",
+    "升 Shēng - Pushing Upward",
+    "困 Kùn - Oppression (Exhaustion)",
+    "井 Jǐng - The Well",
+    "革 Gé - Revolution (Molting)",
+    "鼎 Dǐng - The Cauldron",
+    "震 Zhèn - The Arousing (Shock, Thunder)",
+    "艮 Gèn - Keeping Still (Mountain)",
+    "漸 Jiàn - Development (Gradual Progress)",
+    "歸妹 Guī Mèi - The Marrying Maiden",
+    "豐 Fēng - Abundance (Fullness)",
+    "旅 Lǚ - The Wanderer",
+    "巽 Xùn - The Gentle (Penetrating, Wind)",
+    "兌 Duì - The Joyous (Lake)",
+    "渙 Huàn - Dispersion (Dissolution)",
+    "節 Jié - Limitation (Moderation)",
+    "中孚 Zhōng Fú - Inner Truth",
+    "小過 Xiǎo Guò - Preponderance of the Small",
+    "既濟 Jì Jì - After Completion",
+    "未濟 Wèi Jì - Before Completion",
+)
+
+# bitstrings: 6-bit left=top-most hao, right=bottom-most
+BITSTRINGS: Tuple[str, ...] = tuple(format(i, "06b") for i in range(64))
+BITSTRING_TO_ID: Dict[str, int] = {bs: i for i, bs in enumerate(BITSTRINGS)}
+
+# map top3 bits -> trigram name (Sino-Vietnamese names possible)
+TRIGRAM_MAP = {
+    "111": "Qian",  # 乾
+    "000": "Kun",   # 坤
+    "010": "Kan",   # 坎 (note mapping depends on bit ordering used)
+    "101": "Li",    # 離
+    "001": "Zhen",  # 震
+    "110": "Dui",   # 兌
+    "011": "Xun",   # 巽
+    "100": "Gen",   # 艮
+}
+
+# map trigram -> Wuxing element (common fengshui mapping)
+# Qian, Dui -> Metal; Zhen, Xun -> Wood; Kun, Gen -> Earth; Li -> Fire; Kan -> Water
+TRIGRAM_TO_ELEMENT = {
+    "Qian": "Metal",
+    "Dui": "Metal",
+    "Zhen": "Wood",
+    "Xun": "Wood",
+    "Kun": "Earth",
+    "Gen": "Earth",
+    "Li": "Fire",
+    "Kan": "Water"
+}
+
+# Wuxing generation map: what element generates what
+GENERATION = {
+    "Wood": "Fire",
+    "Fire": "Earth",
+    "Earth": "Metal",
+    "Metal": "Water",
+    "Water": "Wood"
+}
+
+RELATION_WEIGHTS = {"Opposite": 3.0, "Transform": 1.0, "Ally": 2.0, "Support": 2.5}
+
+FULL_MASK = 0b111111
+
+# Optional on-disk snapshot of the relation tables (pickle). Empty -> build in memory only.
+HEXAGRAM_SNAPSHOT = os.getenv("HEXAGRAM_SNAPSHOT", "")
+SNAPSHOT_VERSION = 1
+
+
+# ---------------- frozen relation tables (built once at import) ----------------
+def _build_tables() -> Dict[str, Any]:
+    """
+    Precompute the 64-node relation tables with bit operations:
+    - Opposite:  i ^ 0b111111
+    - Transform: i ^ (1 << k), k = 0..5
+    - Ally:      same top3, i.e. i >> 3 equal
+    - Support:   element(a) generates element(b)
+    Neighbour order replays the edge insertion order of the old networkx build,
+    so relations_of / relations_compact return lists in the same order as before.
+    """
+    trigrams = tuple(TRIGRAM_MAP.get(bits[:3], "Unknown") for bits in BITSTRINGS)
+    elements = tuple(TRIGRAM_TO_ELEMENT.get(t, "Unknown") for t in trigrams)
+
+    # edges in original insertion order: (u, v, relation, source, target)
+    edges = []
+    for i in range(64):
+        j = i ^ FULL_MASK
+        if i < j:
+            edges.append((i, j, "Opposite", None, None))
+        for k in range(6):
+            j2 = i ^ (1 << (5 - k))  # k=0 -> top-most bit, same as string index
+            if i < j2:
+                edges.append((i, j2, "Transform", None, None))
+        for j3 in range(i + 1, 64):
+            if (i >> 3) == (j3 >> 3):
+                edges.append((i, j3, "Ally", None, None))
+    for a in range(64):
+        generated = GENERATION.get(elements[a])
+        if not generated:
+            continue
+        for b in range(64):
+            if a != b and elements[b] == generated:
+                edges.append((min(a, b), max(a, b), "Support", a, b))
+
+    # adjacency order = first time two nodes got connected
+    order: List[Dict[int, None]] = [{} for _ in range(64)]
+    for u, v, _, _, _ in edges:
+        order[u].setdefault(v, None)
+        order[v].setdefault(u, None)
+
+    opposite = tuple(i ^ FULL_MASK for i in range(64))
+    transform_sets = [{i ^ (1 << k) for k in range(6)} for i in range(64)]
+    support_out_sets = [{b for b in range(64) if b != a and elements[b] == GENERATION.get(elements[a])} for a in range(64)]
+    support_in_sets = [{b for b in range(64) if a in support_out_sets[b]} for a in range(64)]
+
+    def ordered(i: int, members) -> Tuple[int, ...]:
+        return tuple(n for n in order[i] if n in members)
+
+    return {
+        "trigrams": trigrams,
+        "elements": elements,
+        "edges": tuple(edges),
+        "Opposite": tuple((opposite[i],) for i in range(64)),
+        "Transform": tuple(ordered(i, transform_sets[i]) for i in range(64)),
+        "Ally": tuple(ordered(i, {j for j in range(64) if j != i and (i >> 3) == (j >> 3)}) for i in range(64)),
+        "Support_in": tuple(ordered(i, support_in_sets[i]) for i in range(64)),
+        "Support_out": tuple(ordered(i, support_out_sets[i]) for i in range(64)),
+    }
+
+
+def _tables_signature() -> str:
+    """Hash of the rules the tables are built from; a stale snapshot is rebuilt."""
+    raw = json.dumps(
+        [SNAPSHOT_VERSION, TRIGRAM_MAP, TRIGRAM_TO_ELEMENT, GENERATION, RELATION_WEIGHTS],
+        sort_keys=True,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def save_tables_snapshot(path: str, tables: Optional[Dict[str, Any]] = None):
+    """Write tables to path atomically (tmp file + os.replace)."""
+    tables = tables or _TABLES
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"signature": _tables_signature(), "tables": tables}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_tables_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """Return tables from snapshot, or None if missing/corrupt/stale."""
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(data, dict) or data.get("signature") != _tables_signature():
+        return None
+    return data.get("tables")
+
+
+def _load_or_build_tables() -> Dict[str, Any]:
+    if not HEXAGRAM_SNAPSHOT:
+        return _build_tables()
+    tables = load_tables_snapshot(HEXAGRAM_SNAPSHOT)
+    if tables is not None:
+        return tables
+    tables = _build_tables()
+    try:
+        save_tables_snapshot(HEXAGRAM_SNAPSHOT, tables)
+    except Exception as e:
+        print("⚠️ Không ghi được hexagram snapshot:", e)
+    return tables
+
+
+_TABLES = _load_or_build_tables()
+
 
 class HexagramService:
     """
     HexagramService (King-Wen names + Wuxing support rule).
-    - MultiGraph but avoid duplicate same-relation edges.
+    - Relations come from frozen module-level tables (no graph walk per lookup).
     - Names follow King-Wen order (index 0..63 -> hexagram 1..64).
     - Element of a hexagram = element of its TOP3 (upper trigram).
     - Support: A -> B if element(A) generates element(B) in Wuxing.
     - Provides detailed relations and a compact JSON (ids only).
+    - networkx is only needed for get_graph() (export).
     """
 
     def __init__(self, names: Optional[List[str]] = None):
-        self.G = nx.MultiGraph()
-        # King-Wen order names (Chinese, pinyin, English). Index 0 -> hexagram 1.
-        self.hexagram_names = names or [
-            "乾 Qián - The Creative",
-            "坤 Kūn - The Receptive",
-            "屯 Zhūn - Difficulty at the Beginning",
-            "蒙 Méng - Youthful Folly",
-            "需 Xū - Waiting (Attending)",
-            "訟 Sòng - Conflict",
-            "師 Shī - The Army",
-            "比 Bǐ - Holding Together",
-            "小畜 Xiǎo Xù - Taming the Power of the Small",
-            "履 Lǚ - Treading (Conduct)",
-            "泰 Tài - Peace",
-            "否 Pǐ - Standstill (Stagnation)",
-            "同人 Tóng Rén - Fellowship with Men",
-            "大有 Dà Yǒu - Possession in Great Measure",
-            "謙 Qiān - Modesty",
-            "豫 Yù - Enthusiasm",
-            "隨 Suí - Following",
-            "蠱 Gǔ - Work on the Decayed",
-            "臨 Lín - Approach",
-            "觀 Guān - Contemplation (Viewing)",
-            "噬嗑 Shì Kè - Biting Through",
-            "賁 Bì - Grace (Adorning)",
-            "剝 Bō - Splitting Apart",
-            "復 Fù - Return (Turning Back)",
-            "無妄 Wú Wàng - Innocence (The Unexpected)",
-            "大畜 Dà Xù - Great Taming",
-            "頤 Yí - Corners of the Mouth (Nourishment)",
-            "大過 Dà Guò - Preponderance of the Great",
-            "坎 Kǎn - The Abysmal (Water)",
-            "離 Lí - The Clinging (Fire)",
-            "咸 Xián - Influence (Conjoining)",
-            "恒 Héng - Duration",
-            "遯 Dùn - Retreat",
-            "大壯 Dà Zhuàng - Great Power",
-            "晉 Jìn - Progress (Advancement)",
-            "明夷 Míng Yí - Darkening of the Light",
-            "家人 Jiā Rén - The Family",
-            "睽 Kuí - Opposition",
-            "蹇 Jiǎn - Obstruction (Difficulty)",
-            "解 Xiè - Deliverance",
-            "損 Sǔn - Decrease",
-            "益 Yì - Increase",
-            "夬 Guài - Breakthrough (Resolution)",
-            "姤 Gòu - Coming to Meet",
-            "萃 Cuì - Gathering Together (Massing)",
-            "升 Shēng - Pushing Upward",
-            "困 Kùn - Oppression (Exhaustion)",
-            "井 Jǐng - The Well",
-            "革 Gé - Revolution (Molting)",
-            "鼎 Dǐng - The Cauldron",
-            "震 Zhèn - The Arousing (Shock, Thunder)",
-            "艮 Gèn - Keeping Still (Mountain)",
-            "漸 Jiàn - Development (Gradual Progress)",
-            "歸妹 Guī Mèi - The Marrying Maiden",
-            "豐 Fēng - Abundance (Fullness)",
-            "旅 Lǚ - The Wanderer",
-            "巽 Xùn - The Gentle (Penetrating, Wind)",
-            "兌 Duì - The Joyous (Lake)",
-            "渙 Huàn - Dispersion (Dissolution)",
-            "節 Jié - Limitation (Moderation)",
-            "中孚 Zhōng Fú - Inner Truth",
-            "小過 Xiǎo Guò - Preponderance of the Small",
-            "既濟 Jì Jì - After Completion",
-            "未濟 Wèi Jì - Before Completion"
-        ]
-
-        # bitstrings: 6-bit left=top-most hao, right=bottom-most
-        self.bitstrings = [format(i, "06b") for i in range(64)]
-
-        # map top3 bits -> trigram name (Sino-Vietnamese names possible)
-        self.trigram_map = {
-            "111": "Qian",  # 乾
-            "000": "Kun",   # 坤
-            "010": "Kan",   # 坎 (note mapping depends on bit ordering used)
-            "101": "Li",    # 離
-            "001": "Zhen",  # 震
-            "110": "Dui",   # 兌
-            "011": "Xun",   # 巽
-            "100": "Gen",   # 艮
-        }
-
-        # map trigram -> Wuxing element (common fengshui mapping)
-        # Qian, Dui -> Metal; Zhen, Xun -> Wood; Kun, Gen -> Earth; Li -> Fire; Kan -> Water
-        self.trigram_to_element = {
-            "Qian": "Metal",
-            "Dui": "Metal",
-            "Zhen": "Wood",
-            "Xun": "Wood",
-            "Kun": "Earth",
-            "Gen": "Earth",
-            "Li": "Fire",
-            "Kan": "Water"
-        }
-
-        # Wuxing generation map: what element generates what
-        self.generation = {
-            "Wood": "Fire",
-            "Fire": "Earth",
-            "Earth": "Metal",
-            "Metal": "Water",
-            "Water": "Wood"
-        }
-
-        # build graph now
-        self._build_graph()
+        self.hexagram_names = list(names or DEFAULT_HEXAGRAM_NAMES)
+        self.bitstrings = list(BITSTRINGS)
+        self.trigram_map = TRIGRAM_MAP
+        self.trigram_to_element = TRIGRAM_TO_ELEMENT
+        self.generation = GENERATION
+        self.tables = _TABLES
+        self._reindex()
 
     # ---------------- helpers ----------------
     def set_names(self, names: List[str]):
         if len(names) != 64:
             raise ValueError("names must have length 64")
-        self.hexagram_names = names
+        self.hexagram_names = list(names)
+        self._reindex()
+
+    def _reindex(self):
+        """Rebuild name -> id index and drop cached relations (names changed)."""
+        self.name_to_id: Dict[str, int] = {}
         for i in range(64):
-            if self.G.has_node(i):
-                self.G.nodes[i]["name"] = names[i]
+            self.name_to_id.setdefault(self._name(i), i)
+        self._relations_cache: Dict[int, Dict[str, Any]] = {}
 
     def _get_trigram(self, bits: str) -> str:
         return self.trigram_map.get(bits[:3], "Unknown")
@@ -139,91 +272,54 @@ class HexagramService:
         trig = self._get_trigram(bits)
         return self.trigram_to_element.get(trig, "Unknown")
 
-    def _rel_exists(self, u:int, v:int, relation:str, source:Optional[int]=None, target:Optional[int]=None) -> bool:
-        if not self.G.has_edge(u, v):
-            return False
-        data = self.G.get_edge_data(u, v)
-        for k, attrs in data.items():
-            if attrs.get("relation") != relation:
-                continue
-            if relation == "Support":
-                if attrs.get("source") == source and attrs.get("target") == target:
-                    return True
-            else:
-                return True
-        return False
-
-    def _add_rel(self, u:int, v:int, relation:str, weight:float, source:Optional[int]=None, target:Optional[int]=None):
-        a, b = (min(u,v), max(u,v))
-        if self._rel_exists(a, b, relation, source, target):
-            return
-        attrs = {"relation": relation, "weight": weight}
-        if relation == "Support":
-            attrs.update({"source": source, "target": target})
-        self.G.add_edge(a, b, **attrs)
-
-    # ---------------- build ----------------
-    def _build_graph(self):
-        # nodes
+    def warm(self):
+        """Prebuild the relations cache for all 64 hexagrams."""
         for i in range(64):
-            bits = self.bitstrings[i]
-            self.G.add_node(i,
-                            id=i,
-                            name=self.hexagram_names[i] if i < len(self.hexagram_names) else f"Hex {i+1}",
-                            bits=bits,
-                            top3=bits[:3],
-                            bot3=bits[3:],
-                            trigram=self._get_trigram(bits),
-                            element=self._get_element(bits))
-
-        # edges
-        for i in range(64):
-            bits_i = self.bitstrings[i]
-            top_i = bits_i[:3]
-
-            # Opposite: invert all bits (undirected) -> i < j to add once
-            opp = "".join("1" if b == "0" else "0" for b in bits_i)
-            j = self.bitstrings.index(opp)
-            if i < j:
-                self._add_rel(i, j, "Opposite", 3.0)
-
-            # Transform: differ by exactly 1 bit (undirected) -> add i<j
-            for k in range(6):
-                flipped = bits_i[:k] + ("1" if bits_i[k] == "0" else "0") + bits_i[k+1:]
-                j2 = self.bitstrings.index(flipped)
-                if i < j2:
-                    self._add_rel(i, j2, "Transform", 1.0)
-
-            # Ally: same top3 (undirected); j>i to add once
-            for j3 in range(i+1, 64):
-                if top_i == self.bitstrings[j3][:3]:
-                    self._add_rel(i, j3, "Ally", 2.0)
-
-        # Support by Wuxing: directed A -> B if element(A) generates element(B)
-        for a in range(64):
-            elem_a = self.G.nodes[a]["element"]
-            if elem_a == "Unknown":
-                continue
-            generated = self.generation.get(elem_a)
-            if not generated:
-                continue
-            # find all hexagrams whose element == generated -> a supports them
-            for b in range(64):
-                if a == b:
-                    continue
-                if self.G.nodes[b]["element"] == generated:
-                    # store directed support as attrs source=a, target=b
-                    self._add_rel(a, b, "Support", 2.5, source=a, target=b)
+            if i not in self._relations_cache:
+                self._relations_cache[i] = self._build_relations(i)
+
+    def _name(self, i: int) -> str:
+        return self.hexagram_names[i] if i < len(self.hexagram_names) else f"Hex {i+1}"
+
+    def _entry(self, other: int, relation: str) -> Dict[str, Any]:
+        return {
+            "id": other,
+            "name": self._name(other),
+            "bits": BITSTRINGS[other],
+            "trigram": self.tables["trigrams"][other],
+            "element": self.tables["elements"][other],
+            "weight": RELATION_WEIGHTS[relation],
+            "relation": relation
+        }
 
     # ---------------- public API ----------------
-    def get_graph(self) -> nx.MultiGraph:
-        return self.G
+    def get_graph(self):
+        """Export relations as a networkx MultiGraph (same nodes/edges as before)."""
+        import networkx as nx
+
+        G = nx.MultiGraph()
+        for i in range(64):
+            G.add_node(i, **self.get_node(i))
+        for u, v, relation, source, target in self.tables["edges"]:
+            attrs = {"relation": relation, "weight": RELATION_WEIGHTS[relation]}
+            if relation == "Support":
+                attrs.update({"source": source, "target": target})
+            G.add_edge(u, v, **attrs)
+        return G
 
     def find_by_name(self, name: str) -> Tuple[Optional[int], Optional[Dict[str,Any]]]:
-        for n, data in self.G.nodes(data=True):
-            if data.get("name") == name:
-                return n, dict(data)
-        return None, None
+        idx = self.name_to_id.get(name)
+        if idx is None:
+            return None, None
+        return idx, self.get_node(idx)
+
+    def find_by_bitstring(self, bitstring: str) -> Optional[int]:
+        """bitstring (top-first, vd '111000') -> id, None nếu không hợp lệ."""
+        return BITSTRING_TO_ID.get(bitstring)
+
+    def find_by_bits(self, bits: int) -> Optional[int]:
+        """int bits (0..63) -> id. id trùng giá trị bits nên chỉ cần kiểm tra phạm vi."""
+        return bits if isinstance(bits, int) and 0 <= bits < 64 else None
 
     def relations_of(self, name: str) -> Optional[Dict[str, Any]]:
         """
@@ -238,41 +334,41 @@ class HexagramService:
           }
         }
         """
-        idx, node = self.find_by_name(name)
+        idx = self.name_to_id.get(name)
         if idx is None:
             return None
+        return self.relations_by_id(idx)
 
-        groups = {"Opposite": [], "Transform": [], "Ally": [], "Support": {"in": [], "out": []}}
-        for u, v, key, data in self.G.edges(idx, keys=True, data=True):
-            other = v if u == idx else u
-            rel = data.get("relation")
-            entry = {
-                "id": other,
-                "name": self.G.nodes[other]["name"],
-                "bits": self.G.nodes[other]["bits"],
-                "trigram": self.G.nodes[other]["trigram"],
-                "element": self.G.nodes[other]["element"],
-                "weight": data.get("weight"),
-                "relation": rel
-            }
-            if rel == "Support":
-                src = data.get("source")
-                tgt = data.get("target")
-                if tgt == idx and src is not None:
-                    entry["incoming"] = True
-                    entry["source"] = src
-                    entry["target"] = tgt
-                    groups["Support"]["in"].append(entry)
-                elif src == idx and tgt is not None:
-                    entry["incoming"] = False
-                    entry["source"] = src
-                    entry["target"] = tgt
-                    groups["Support"]["out"].append(entry)
-                else:
-                    entry["incoming"] = None
-                    groups["Support"]["out"].append(entry)
-            else:
-                groups.setdefault(rel, []).append(entry)
+    def relations_by_id(self, idx: int) -> Optional[Dict[str, Any]]:
+        """Như relations_of nhưng nhận id; kết quả được cache theo id (trả về bản copy)."""
+        cached = self._relations_cache.get(idx)
+        if cached is None:
+            cached = self._build_relations(idx)
+            if cached is None:
+                return None
+            self._relations_cache[idx] = cached
+        return copy.deepcopy(cached)
+
+    def _build_relations(self, idx: int) -> Optional[Dict[str, Any]]:
+        node = self.get_node(idx)
+        if node is None:
+            return None
+
+        t = self.tables
+        groups = {
+            "Opposite": [self._entry(o, "Opposite") for o in t["Opposite"][idx]],
+            "Transform": [self._entry(o, "Transform") for o in t["Transform"][idx]],
+            "Ally": [self._entry(o, "Ally") for o in t["Ally"][idx]],
+            "Support": {"in": [], "out": []},
+        }
+        for src in t["Support_in"][idx]:
+            entry = self._entry(src, "Support")
+            entry.update({"incoming": True, "source": src, "target": idx})
+            groups["Support"]["in"].append(entry)
+        for tgt in t["Support_out"][idx]:
+            entry = self._entry(tgt, "Support")
+            entry.update({"incoming": False, "source": idx, "target": tgt})
+            groups["Support"]["out"].append(entry)
 
         return {
             "id": idx,
@@ -297,21 +393,19 @@ class HexagramService:
           "Support_out": [1,2,...]
         }
         """
-        info = self.relations_of(name)
-        if info is None:
+        idx = self.name_to_id.get(name)
+        if idx is None:
+            return None
+        return self.relations_compact_by_id(idx, include)
+
+    def relations_compact_by_id(self, idx: int, include: Optional[List[str]] = None) -> Optional[Dict[str, List[int]]]:
+        if self.find_by_bits(idx) is None:
             return None
         inc = set(include or ["Opposite","Transform","Ally","Support_in","Support_out"])
         out: Dict[str, List[int]] = {}
-        if "Opposite" in inc:
-            out["Opposite"] = [e["id"] for e in info["relations"]["Opposite"]]
-        if "Transform" in inc:
-            out["Transform"] = [e["id"] for e in info["relations"]["Transform"]]
-        if "Ally" in inc:
-            out["Ally"] = [e["id"] for e in info["relations"]["Ally"]]
-        if "Support_in" in inc:
-            out["Support_in"] = [e["id"] for e in info["relations"]["Support"]["in"]]
-        if "Support_out" in inc:
-            out["Support_out"] = [e["id"] for e in info["relations"]["Support"]["out"]]
+        for key in ("Opposite", "Transform", "Ally", "Support_in", "Support_out"):
+            if key in inc:
+                out[key] = list(self.tables[key][idx])
         return out
 
     def describe_hexagram(self, name: str) -> str:
@@ -347,9 +441,18 @@ class HexagramService:
         Trả về thông tin 1 quẻ theo index (0..63).
         Ví dụ: get_node(0) -> Quẻ 乾
         """
-        if idx not in self.G.nodes:
+        if not isinstance(idx, int) or not 0 <= idx < 64:
             return None
-        return dict(self.G.nodes[idx])
+        bits = BITSTRINGS[idx]
+        return {
+            "id": idx,
+            "name": self._name(idx),
+            "bits": bits,
+            "top3": bits[:3],
+            "bot3": bits[3:],
+            "trigram": self.tables["trigrams"][idx],
+            "element": self.tables["elements"][idx],
+        }
 
 # ---------------- quick run example ----------------
 if __name__ == "__main__":
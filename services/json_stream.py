@@ -0,0 +1,87 @@
+# services/json_stream.py
+import json
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class IncrementalJSONParser:
+    """
+    Parse dần JSON object từ stream token của LLM.
+    - Bỏ qua text trước dấu `{` đầu tiên (```json, lời dẫn...).
+    - Mỗi field top-level hoàn chỉnh → lưu vào self.fields và gọi on_field(key, value).
+    - done = object đã đóng, hoặc đã đủ mọi field required (có thể ngắt stream sớm).
+    """
+
+    def __init__(self, required: Iterable[str] = (), on_field: Optional[Callable[[str, Any], None]] = None):
+        self.required = set(required)
+        self.on_field = on_field
+        self.fields: Dict[str, Any] = {}
+        self.started = False
+        self.closed = False
+        self._chars = []
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._member_start = 0
+
+    @property
+    def done(self) -> bool:
+        return self.closed or (bool(self.required) and self.required.issubset(self.fields))
+
+    def feed(self, chunk: str) -> bool:
+        """Nạp thêm 1 đoạn text, trả về self.done."""
+        for ch in chunk:
+            if self.closed:
+                break
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self._depth = 1
+                    self._chars = ["{"]
+                    self._member_start = 1
+                continue
+
+            self._chars.append(ch)
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+
+            if ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._member(len(self._chars) - 1)
+                    self.closed = True
+            elif ch == "," and self._depth == 1:
+                self._member(len(self._chars) - 1)
+                self._member_start = len(self._chars)
+        return self.done
+
+    def _member(self, end: int):
+        segment = "".join(self._chars[self._member_start:end]).strip()
+        if not segment:
+            return
+        try:
+            member = json.loads("{" + segment + "}")
+        except ValueError:
+            return
+        for key, value in member.items():
+            self.fields[key] = value
+            if self.on_field:
+                try:
+                    self.on_field(key, value)
+                except Exception as e:
+                    print(f"⚠️ on_field({key}) lỗi: {e}")
+
+    def result(self) -> str:
+        """JSON string: nguyên object nếu đã đóng, không thì dựng lại từ các field đã có."""
+        if self.closed:
+            return "".join(self._chars)
+        return json.dumps(self.fields, ensure_ascii=False)
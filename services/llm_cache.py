@@ -0,0 +1,173 @@
+# services/llm_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", ".cache/llm_cache.sqlite")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))             # giây, 0 = không hết hạn
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))  # vượt quá → xoá LRU
+# Mặc định (deterministic): chỉ cache call temperature == 0, không hết hạn.
+# LLM_CACHE_DETERMINISTIC=0 → cache cả call temperature > 0 (có TTL), phải bật tường minh.
+LLM_CACHE_DETERMINISTIC = os.getenv("LLM_CACHE_DETERMINISTIC", "1") != "0"
+
+# Bật trong lúc node retry: không đọc cache (tránh trả lại đúng response vừa bị từ chối),
+# response mới vẫn được ghi đè vào cache
+_bypass: contextvars.ContextVar = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_cache(active: bool = True) -> Iterator[None]:
+    token = _bypass.set(active)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def cache_key(provider: str, model: str, temperature: float, prompt: str) -> str:
+    """Key content-addressed: sha256 của (provider, model, temperature, prompt)."""
+    raw = json.dumps([provider, model, float(temperature), prompt], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Cache response LLM trên SQLite.
+    - TTL theo created_at, LRU theo last_access khi vượt max_entries.
+    - deterministic=True → chỉ cache call temperature 0 và bỏ TTL.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_DB, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, deterministic: bool = LLM_CACHE_DETERMINISTIC):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.deterministic = deterministic
+        self._lock = threading.Lock()
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                model TEXT,
+                value TEXT,
+                created_at REAL,
+                last_access REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+        self._conn.commit()
+
+    def cacheable(self, temperature: float) -> bool:
+        return not self.deterministic or float(temperature) == 0.0
+
+    def get(self, key: str) -> Optional[str]:
+        if _bypass.get():
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl and not self.deterministic and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str, provider: str = "", model: str = ""):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, provider, model, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model, value, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl and not self.deterministic:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.max_entries:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            extra = count - self.max_entries
+            if extra > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (extra,),
+                )
+
+    def forget(self, key: str):
+        """Xoá 1 entry (vd response bị caller từ chối vì parse lỗi)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def cached_call(self, provider: str, model: str, temperature: float, prompt: str,
+                    fn: Callable[[], str], validate: Optional[Callable[[str], Any]] = None) -> str:
+        """
+        Trả về response đã cache, hoặc gọi fn() rồi lưu lại.
+        validate(value) raise → không lưu (response caller sẽ từ chối thì không được replay).
+        """
+        if not self.cacheable(temperature):
+            return fn()
+        key = cache_key(provider, model, temperature, prompt)
+        hit = self.get(key)
+        if hit is not None:
+            return hit
+        value = fn()
+        if value and is_valid(value, validate):
+            self.set(key, value, provider, model)
+        return value
+
+
+def is_valid(value: Any, validate: Optional[Callable[[Any], Any]]) -> bool:
+    if validate is None:
+        return True
+    try:
+        validate(value)
+        return True
+    except Exception:
+        print("⚠️ Response LLM không hợp lệ, không lưu cache")
+        return False
+
+
+_store: Optional[LLMCache] = None
+_store_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Store dùng chung cho cả process; None nếu LLM_CACHE_ENABLED=0."""
+    global _store
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = LLMCache()
+        return _store
@@ -0,0 +1,697 @@
+# services/llm_gateway.py
+"""
+Gateway LLM dùng chung cho toàn bộ node:
+- Client pool theo provider (tạo lazy, dùng lại connection).
+- Token bucket theo (provider, model) → không vượt RPM của provider khi chạy song song.
+- Exponential backoff cho 429 / 5xx / lỗi kết nối (client SDK tắt retry riêng).
+- Gộp (coalesce) các prompt giống hệt nhau đang chạy đồng thời thành 1 request.
+- Entry point sync (chat, chat_model().invoke) và async (achat, chat_model().ainvoke).
+- Streaming (stream_chat / stream_json) với parse JSON dần và ngắt sớm khi đủ field.
+"""
+import os
+import time
+import json
+import random
+import asyncio
+import hashlib
+import threading
+import weakref
+import warnings
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.load import dumps, loads
+from langchain_core.runnables import Runnable
+
+from services.json_stream import IncrementalJSONParser
+from services.llm_cache import cache_key, get_llm_cache, is_valid
+from services.metrics import record_llm, record_retry
+from services.prompt_context import estimate_tokens
+
+load_dotenv()
+
+DEFAULT_MODELS = {
+    "groq": "openai/gpt-oss-120b",
+    "gemini": "gemini-2.5-flash",
+    "openai": "gpt-4o-mini",
+}
+
+API_KEY_ENV = {
+    "groq": "GROQ_API_KEY",
+    "gemini": "GOOGLE_API_KEY",
+    "openai": "OPENAI_API_KEY",
+}
+
+# Số request / phút cho mỗi model của provider
+LLM_RPM = {
+    "groq": float(os.getenv("LLM_RPM_GROQ", "30")),
+    "gemini": float(os.getenv("LLM_RPM_GEMINI", "10")),
+    "openai": float(os.getenv("LLM_RPM_OPENAI", "60")),
+}
+LLM_BURST = int(os.getenv("LLM_BURST", "3"))           # số request được bắn liền một lúc
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))  # giây
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))     # giây
+
+GROQ_OPTIONS = {
+    "max_completion_tokens": int(os.getenv("GROQ_MAX_COMPLETION_TOKENS", "8192")),
+    "top_p": 1,
+    "reasoning_effort": "medium",
+}
+
+
+# ---------------- Rate limit ----------------
+class TokenBucket:
+    """
+    Token bucket thread-safe. reserve() giữ chỗ 1 token và trả về số giây phải chờ,
+    nên dùng được cho cả sync (time.sleep) lẫn async (asyncio.sleep).
+    """
+
+    def __init__(self, rate_per_min: float, capacity: int = LLM_BURST):
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider: str, model: str) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get((provider, model))
+        if bucket is None:
+            bucket = _buckets[(provider, model)] = TokenBucket(LLM_RPM.get(provider, 60))
+        return bucket
+
+
+# ---------------- Retry ----------------
+def _status_of(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(value, int):
+        return value
+    name = type(exc).__name__
+    if any(k in name for k in ("RateLimit", "ResourceExhausted", "TooManyRequests")):
+        return 429
+    if any(k in name for k in ("ServiceUnavailable", "InternalServerError", "DeadlineExceeded")):
+        return 503
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = _status_of(exc)
+    if status is not None:
+        return status == 429 or 500 <= status < 600
+    name = type(exc).__name__
+    return "Connection" in name or "Timeout" in name
+
+
+def _backoff_delay(exc: BaseException, attempt: int) -> float:
+    """Ưu tiên header Retry-After, không có thì 2^attempt + jitter."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after", ""))
+        return min(LLM_BACKOFF_MAX, retry_after)
+    except (TypeError, ValueError):
+        pass
+    delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+def _call_with_retry(provider: str, model: str, fn: Callable[[], Any]) -> Any:
+    bucket = get_bucket(provider, model)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        bucket.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = _backoff_delay(e, attempt)
+            record_retry("llm")
+            print(f"⏳ {provider}/{model} lỗi {type(e).__name__}, thử lại sau {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def _acall_with_retry(provider: str, model: str, afn: Callable[[], Any]) -> Any:
+    bucket = get_bucket(provider, model)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await bucket.aacquire()
+        try:
+            return await afn()
+        except Exception as e:
+            if attempt >= LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = _backoff_delay(e, attempt)
+            record_retry("llm")
+            print(f"⏳ {provider}/{model} lỗi {type(e).__name__}, thử lại sau {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+# ---------------- Coalescing ----------------
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _request_key(provider: str, model: str, temperature: Any, payload: Any) -> str:
+    raw = json.dumps([provider, model, temperature, payload], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _join(key: str) -> Tuple[Future, bool]:
+    """Trả về (future, is_leader). Leader là request đầu tiên, phải tự gọi API."""
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        if fut is not None:
+            return fut, False
+        fut = _inflight[key] = Future()
+        return fut, True
+
+
+def _finish(key: str, fut: Future, result: Any = None, error: Optional[BaseException] = None):
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+
+def _coalesced(key: str, fn: Callable[[], Any]) -> Any:
+    fut, leader = _join(key)
+    if not leader:
+        return fut.result()
+    try:
+        result = fn()
+    except BaseException as e:
+        _finish(key, fut, error=e)
+        raise
+    _finish(key, fut, result)
+    return result
+
+
+async def _acoalesced(key: str, afn: Callable[[], Any]) -> Any:
+    fut, leader = _join(key)
+    if not leader:
+        return await asyncio.wrap_future(fut)
+    try:
+        result = await afn()
+    except BaseException as e:
+        _finish(key, fut, error=e)
+        raise
+    _finish(key, fut, result)
+    return result
+
+
+# ---------------- Client pool ----------------
+_clients: Dict[Any, Any] = {}
+_clients_lock = threading.Lock()
+_async_groq = weakref.WeakKeyDictionary()  # mỗi event loop 1 AsyncGroq (httpx gắn với loop)
+
+
+def _api_key(provider: str) -> str:
+    env = API_KEY_ENV[provider]
+    key = os.environ.get(env)
+    if not key:
+        raise ValueError(f"Thiếu {env} trong file .env")
+    return key
+
+
+def _pooled(key: Any, factory: Callable[[], Any]) -> Any:
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+
+def groq_client():
+    from groq import Groq
+    return _pooled("groq", lambda: Groq(api_key=_api_key("groq"), max_retries=0))
+
+
+def agroq_client():
+    from groq import AsyncGroq
+    loop = asyncio.get_running_loop()
+    client = _async_groq.get(loop)
+    if client is None:
+        client = _async_groq[loop] = AsyncGroq(api_key=_api_key("groq"), max_retries=0)
+    return client
+
+
+def _build_langchain_model(provider: str, model: str, temperature: Optional[float]):
+    # SDK tắt retry riêng, gateway lo retry + rate limit
+    kwargs: Dict[str, Any] = {"model": model, "api_key": _api_key(provider), "max_retries": 0}
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(**kwargs)
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(**kwargs)
+    raise ValueError(f"Provider không hỗ trợ LangChain model: {provider}")
+
+
+def langchain_model(provider: str, model: Optional[str] = None, temperature: Optional[float] = 0.7):
+    model = model or DEFAULT_MODELS[provider]
+    return _pooled((provider, model, temperature),
+                   lambda: _build_langchain_model(provider, model, temperature))
+
+
+# ---------------- Entry point: text → text ----------------
+def _record_usage(provider: str, model: str, result: Any):
+    """Ghi token usage: Groq trả completion.usage, LangChain trả AIMessage.usage_metadata."""
+    usage = getattr(result, "usage", None)
+    if usage is not None:
+        record_llm(provider, model, getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+        return
+    meta = getattr(result, "usage_metadata", None) or {}
+    record_llm(provider, model, meta.get("input_tokens", 0), meta.get("output_tokens", 0))
+
+
+def _groq_messages(prompt: str):
+    return [{"role": "user", "content": prompt}]
+
+
+def _complete(provider: str, model: str, temperature: float, prompt: str, options: dict) -> str:
+    if provider == "groq":
+        completion = groq_client().chat.completions.create(
+            model=model,
+            messages=_groq_messages(prompt),
+            temperature=temperature,
+            stream=False,
+            **{**GROQ_OPTIONS, **options},
+        )
+        _record_usage(provider, model, completion)
+        return completion.choices[0].message.content
+    resp = langchain_model(provider, model, temperature).invoke(prompt, **options)
+    _record_usage(provider, model, resp)
+    return getattr(resp, "content", resp)
+
+
+async def _acomplete(provider: str, model: str, temperature: float, prompt: str, options: dict) -> str:
+    if provider == "groq":
+        completion = await agroq_client().chat.completions.create(
+            model=model,
+            messages=_groq_messages(prompt),
+            temperature=temperature,
+            stream=False,
+            **{**GROQ_OPTIONS, **options},
+        )
+        _record_usage(provider, model, completion)
+        return completion.choices[0].message.content
+    resp = await langchain_model(provider, model, temperature).ainvoke(prompt, **options)
+    _record_usage(provider, model, resp)
+    return getattr(resp, "content", resp)
+
+
+def chat(prompt: str, provider: str = "groq", model: Optional[str] = None,
+         temperature: float = 0.7, validate: Optional[Callable[[str], Any]] = None, **options) -> str:
+    """
+    Gọi LLM (sync) và trả về text; qua cache → coalesce → rate limit → retry.
+    validate(text) raise → response không được lưu cache.
+    """
+    model = model or DEFAULT_MODELS[provider]
+    key = _request_key(provider, model, temperature, [prompt, options])
+
+    def call():
+        return _coalesced(key, lambda: _call_with_retry(
+            provider, model, lambda: _complete(provider, model, temperature, prompt, options)))
+
+    cache = get_llm_cache() if provider == "groq" and not options else None
+    if cache is None:
+        return call()
+    return cache.cached_call(provider, model, temperature, prompt, call, validate)
+
+
+async def achat(prompt: str, provider: str = "groq", model: Optional[str] = None,
+                temperature: float = 0.7, validate: Optional[Callable[[str], Any]] = None, **options) -> str:
+    """Bản async của chat()."""
+    model = model or DEFAULT_MODELS[provider]
+    key = _request_key(provider, model, temperature, [prompt, options])
+    cache = get_llm_cache() if provider == "groq" and not options else None
+
+    if cache is not None and cache.cacheable(temperature):
+        ckey = cache_key(provider, model, temperature, prompt)
+        hit = await asyncio.to_thread(cache.get, ckey)
+        if hit is not None:
+            return hit
+
+    result = await _acoalesced(key, lambda: _acall_with_retry(
+        provider, model, lambda: _acomplete(provider, model, temperature, prompt, options)))
+
+    if cache is not None and cache.cacheable(temperature) and result and is_valid(result, validate):
+        await asyncio.to_thread(cache.set, ckey, result, provider, model)
+    return result
+
+
+def forget(prompt: str, provider: str = "groq", model: Optional[str] = None, temperature: float = 0.7):
+    """Xoá response đã cache của chat()/stream_json() cho prompt này (caller parse lỗi)."""
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.forget(cache_key(provider, model or DEFAULT_MODELS[provider], temperature, prompt))
+
+
+# ---------------- Entry point: streaming ----------------
+def _remaining(deadline: Optional[float], provider: str, model: str) -> Optional[float]:
+    """Số giây còn lại tới deadline của 1 lần gọi; hết giờ → TimeoutError (stream bị đóng)."""
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError(f"{provider}/{model} quá thời gian chờ")
+    return left
+
+
+def _expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def stream_chat(prompt: str, provider: str = "groq", model: Optional[str] = None,
+                temperature: float = 0.7, timeout: Optional[float] = None, **options) -> Iterator[str]:
+    """
+    Generator trả từng đoạn text. Chỉ retry khi lỗi xảy ra trước token đầu tiên.
+    Đóng generator (break) sẽ đóng luôn stream HTTP → ngừng sinh token.
+    timeout: tổng số giây cho lần gọi (kể cả retry, tính từ lúc qua rate limit);
+    quá hạn → đóng stream, raise TimeoutError.
+    """
+    model = model or DEFAULT_MODELS[provider]
+    bucket = get_bucket(provider, model)
+    deadline = None
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        bucket.acquire()
+        if timeout and deadline is None:
+            deadline = time.monotonic() + timeout  # tính từ lúc được cấp lượt, không tính thời gian xếp hàng
+        stream = None
+        emitted = False
+        try:
+            left = _remaining(deadline, provider, model)
+            if provider == "groq":
+                stream = groq_client().chat.completions.create(
+                    model=model,
+                    messages=_groq_messages(prompt),
+                    temperature=temperature,
+                    stream=True,
+                    **({"timeout": left} if left is not None else {}),
+                    **{**GROQ_OPTIONS, **options},
+                )
+                for chunk in stream:
+                    _remaining(deadline, provider, model)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        emitted = True
+                        yield delta
+            else:
+                for chunk in langchain_model(provider, model, temperature).stream(prompt, **options):
+                    _remaining(deadline, provider, model)
+                    text = getattr(chunk, "content", "")
+                    if text:
+                        emitted = True
+                        yield text
+            return
+        except Exception as e:
+            if emitted or attempt >= LLM_MAX_RETRIES or not is_retryable(e) or _expired(deadline):
+                raise
+            delay = _backoff_delay(e, attempt)
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            record_retry("llm")
+            print(f"⏳ {provider}/{model} stream lỗi {type(e).__name__}, thử lại sau {delay:.1f}s")
+            time.sleep(delay)
+        finally:
+            if stream is not None:
+                stream.close()
+
+
+async def astream_chat(prompt: str, provider: str = "groq", model: Optional[str] = None,
+                       temperature: float = 0.7, timeout: Optional[float] = None,
+                       **options) -> AsyncIterator[str]:
+    """Bản async của stream_chat()."""
+    model = model or DEFAULT_MODELS[provider]
+    bucket = get_bucket(provider, model)
+    deadline = None
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await bucket.aacquire()
+        if timeout and deadline is None:
+            deadline = time.monotonic() + timeout
+        stream = None
+        emitted = False
+        try:
+            left = _remaining(deadline, provider, model)
+            if provider == "groq":
+                stream = await agroq_client().chat.completions.create(
+                    model=model,
+                    messages=_groq_messages(prompt),
+                    temperature=temperature,
+                    stream=True,
+                    **({"timeout": left} if left is not None else {}),
+                    **{**GROQ_OPTIONS, **options},
+                )
+                async for chunk in stream:
+                    _remaining(deadline, provider, model)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        emitted = True
+                        yield delta
+            else:
+                async for chunk in langchain_model(provider, model, temperature).astream(prompt, **options):
+                    _remaining(deadline, provider, model)
+                    text = getattr(chunk, "content", "")
+                    if text:
+                        emitted = True
+                        yield text
+            return
+        except Exception as e:
+            if emitted or attempt >= LLM_MAX_RETRIES or not is_retryable(e) or _expired(deadline):
+                raise
+            delay = _backoff_delay(e, attempt)
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            record_retry("llm")
+            print(f"⏳ {provider}/{model} stream lỗi {type(e).__name__}, thử lại sau {delay:.1f}s")
+            await asyncio.sleep(delay)
+        finally:
+            if stream is not None:
+                await stream.close()
+
+
+def _json_cache(provider: str, model: str, temperature: float, prompt: str, options: dict):
+    cache = get_llm_cache() if provider == "groq" and not options else None
+    if cache is None or not cache.cacheable(temperature):
+        return None, None
+    return cache, cache_key(provider, model, temperature, prompt)
+
+
+def stream_json(prompt: str, required: Iterable[str] = (), on_field: Optional[Callable[[str, Any], None]] = None,
+                provider: str = "groq", model: Optional[str] = None, temperature: float = 0.7,
+                timeout: Optional[float] = None, validate: Optional[Callable[[str], Any]] = None,
+                **options) -> str:
+    """
+    Stream response và parse JSON dần: on_field(key, value) được gọi ngay khi 1 field
+    top-level hoàn chỉnh; dừng stream khi object đóng hoặc đã đủ field required.
+    Trả về JSON string để PydanticOutputParser.parse như cũ.
+    timeout: xem stream_chat(). validate(json) raise → không lưu cache.
+    """
+    model = model or DEFAULT_MODELS[provider]
+    parser = IncrementalJSONParser(required, on_field)
+    cache, ckey = _json_cache(provider, model, temperature, prompt, options)
+    if cache is not None:
+        hit = cache.get(ckey)
+        if hit is not None:
+            parser.feed(hit)
+            return hit
+
+    pieces = []
+    chunks = stream_chat(prompt, provider, model, temperature, timeout=timeout, **options)
+    try:
+        for delta in chunks:
+            pieces.append(delta)
+            if parser.feed(delta):
+                break
+    finally:
+        chunks.close()
+        if pieces:
+            record_llm(provider, model, estimate_tokens(prompt), estimate_tokens("".join(pieces)))
+
+    if not parser.started:
+        return "".join(pieces)
+    if not parser.closed:
+        print(f"✂️ {provider}/{model} đủ field {sorted(parser.required)}, ngắt stream sớm")
+    elif cache is not None and is_valid(parser.result(), validate):
+        cache.set(ckey, parser.result(), provider, model)
+    return parser.result()
+
+
+async def astream_json(prompt: str, required: Iterable[str] = (),
+                       on_field: Optional[Callable[[str, Any], None]] = None,
+                       provider: str = "groq", model: Optional[str] = None,
+                       temperature: float = 0.7, timeout: Optional[float] = None,
+                       validate: Optional[Callable[[str], Any]] = None, **options) -> str:
+    """Bản async của stream_json()."""
+    model = model or DEFAULT_MODELS[provider]
+    parser = IncrementalJSONParser(required, on_field)
+    cache, ckey = _json_cache(provider, model, temperature, prompt, options)
+    if cache is not None:
+        hit = await asyncio.to_thread(cache.get, ckey)
+        if hit is not None:
+            parser.feed(hit)
+            return hit
+
+    pieces = []
+    chunks = astream_chat(prompt, provider, model, temperature, timeout=timeout, **options)
+    try:
+        async for delta in chunks:
+            pieces.append(delta)
+            if parser.feed(delta):
+                break
+    finally:
+        await chunks.aclose()
+        if pieces:
+            record_llm(provider, model, estimate_tokens(prompt), estimate_tokens("".join(pieces)))
+
+    if not parser.started:
+        return "".join(pieces)
+    if not parser.closed:
+        print(f"✂️ {provider}/{model} đủ field {sorted(parser.required)}, ngắt stream sớm")
+    elif cache is not None and is_valid(parser.result(), validate):
+        await asyncio.to_thread(cache.set, ckey, parser.result(), provider, model)
+    return parser.result()
+
+
+# ---------------- Entry point: LangChain Runnable ----------------
+def _input_key(value: Any) -> Any:
+    if hasattr(value, "to_string"):   # PromptValue
+        return value.to_string()
+    if isinstance(value, list):       # list message
+        return [getattr(m, "content", m) for m in value]
+    return value
+
+
+def _dump_message(resp: Any) -> Optional[str]:
+    try:
+        return dumps(resp)
+    except Exception:
+        return None
+
+
+def _load_message(value: str) -> Any:
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # loads() còn beta → bỏ warning
+            return loads(value)
+    except Exception:
+        return None
+
+
+class GatewayChatModel(Runnable):
+    """
+    Bọc chat model LangChain để mọi invoke/ainvoke đi qua gateway.
+    Dùng như model thường: `prompt | llm | parser`, `llm.invoke(...)`, `llm.bind_tools(...)`.
+    Cache (xem services/llm_cache) chỉ áp dụng cho model chưa bind_tools; caller parse
+    response lỗi thì gọi llm.forget(input) để bỏ entry đó.
+    """
+
+    def __init__(self, provider: str, model: Optional[str] = None,
+                 temperature: Optional[float] = 0.7, bound: Any = None, tag: str = ""):
+        self.provider = provider
+        self.model = model or DEFAULT_MODELS[provider]
+        self.temperature = temperature
+        self._bound = bound
+        self._tag = tag  # phân biệt key coalesce giữa model thường và model đã bind_tools
+
+    @property
+    def runnable(self):
+        return self._bound if self._bound is not None else langchain_model(
+            self.provider, self.model, self.temperature)
+
+    def _key(self, input: Any, kwargs: dict) -> str:
+        return _request_key(self.provider, f"{self.model}{self._tag}", self.temperature,
+                            [_input_key(input), kwargs])
+
+    def _cache(self, input: Any, kwargs: dict):
+        cache = get_llm_cache() if self._bound is None and self.temperature is not None else None
+        if cache is None or not cache.cacheable(self.temperature):
+            return None, None
+        raw = json.dumps([_input_key(input), kwargs], ensure_ascii=False, default=str)
+        return cache, cache_key(self.provider, self.model, self.temperature, raw)
+
+    def forget(self, input: Any, **kwargs: Any):
+        cache, ckey = self._cache(input, kwargs)
+        if cache is not None:
+            cache.forget(ckey)
+
+    def _invoke_once(self, input: Any, config: Any, kwargs: dict) -> Any:
+        resp = self.runnable.invoke(input, config, **kwargs)
+        _record_usage(self.provider, self.model, resp)
+        return resp
+
+    async def _ainvoke_once(self, input: Any, config: Any, kwargs: dict) -> Any:
+        resp = await self.runnable.ainvoke(input, config, **kwargs)
+        _record_usage(self.provider, self.model, resp)
+        return resp
+
+    def invoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        cache, ckey = self._cache(input, kwargs)
+        if cache is not None:
+            hit = cache.get(ckey)
+            resp = _load_message(hit) if hit is not None else None
+            if resp is not None:
+                return resp
+        resp = _coalesced(self._key(input, kwargs), lambda: _call_with_retry(
+            self.provider, self.model, lambda: self._invoke_once(input, config, kwargs)))
+        value = _dump_message(resp) if cache is not None else None
+        if value:
+            cache.set(ckey, value, self.provider, self.model)
+        return resp
+
+    async def ainvoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        cache, ckey = self._cache(input, kwargs)
+        if cache is not None:
+            hit = await asyncio.to_thread(cache.get, ckey)
+            resp = _load_message(hit) if hit is not None else None
+            if resp is not None:
+                return resp
+        resp = await _acoalesced(self._key(input, kwargs), lambda: _acall_with_retry(
+            self.provider, self.model, lambda: self._ainvoke_once(input, config, kwargs)))
+        value = _dump_message(resp) if cache is not None else None
+        if value:
+            await asyncio.to_thread(cache.set, ckey, value, self.provider, self.model)
+        return resp
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "GatewayChatModel":
+        bound = langchain_model(self.provider, self.model, self.temperature).bind_tools(tools, **kwargs)
+        names = ",".join(sorted(getattr(t, "name", str(t)) for t in tools))
+        return GatewayChatModel(self.provider, self.model, self.temperature, bound, f"|tools:{names}")
+
+
+def chat_model(provider: str = "gemini", model: Optional[str] = None,
+               temperature: Optional[float] = 0.7) -> GatewayChatModel:
+    return GatewayChatModel(provider, model, temperature)
@@ -1,15 +1,7 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-import os
-from dotenv import load_dotenv
+from services.llm_gateway import chat_model
 
-load_dotenv()
+GEMINI_MODEL = "gemini-2.5-flash"
+GEMINI_TEMPERATURE = 0.7
 
-api_key = os.environ.get("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("Thiếu GOOGLE_API_KEY")
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    api_key=api_key,
-    temperature=0.7,
-)
+# Gemini qua gateway: client tạo lazy lần gọi đầu, có cache + rate limit + retry
+llm = chat_model("gemini", GEMINI_MODEL, GEMINI_TEMPERATURE)
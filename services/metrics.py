@@ -0,0 +1,187 @@
+# services/metrics.py
+"""
+Đo đạc theo node cho runner:
+- track_node(name) bọc 1 lần gọi node: wall time + mọi LLM/HTTP call/retry xảy ra bên trong
+  (gắn qua ContextVar nên cả thread con dùng copy_context() cũng được tính).
+- Số liệu gộp toàn process → render_prometheus() cho route /metrics.
+- Số liệu từng lần gọi node trả về dạng dict → runner gộp vào state["status"]["metrics"].
+"""
+import time
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+METRIC_FIELDS = ("wall_time", "llm_calls", "llm_tokens_in", "llm_tokens_out",
+                 "http_calls", "http_bytes", "retries")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("node_metrics", default=None)
+_lock = threading.Lock()
+
+# Tổng toàn process, key là tuple label
+_node_runs: Dict[Tuple[str, str], int] = defaultdict(int)          # (node, status)
+_node_seconds: Dict[str, float] = defaultdict(float)               # node
+_node_count: Dict[str, int] = defaultdict(int)                     # node
+_llm_calls: Dict[Tuple[str, str, str], int] = defaultdict(int)     # (node, provider, model)
+_llm_tokens: Dict[Tuple[str, str, str, str], int] = defaultdict(int)  # (node, provider, model, direction)
+_http_calls: Dict[Tuple[str, str], int] = defaultdict(int)         # (node, host)
+_http_bytes: Dict[Tuple[str, str], int] = defaultdict(int)         # (node, host)
+_retries: Dict[Tuple[str, str], int] = defaultdict(int)            # (node, kind)
+
+
+def new_metrics() -> Dict[str, float]:
+    return {k: 0 for k in METRIC_FIELDS}
+
+
+def _node_label() -> Tuple[str, Optional[dict]]:
+    cur = _current.get()
+    if cur is None:
+        return "-", None
+    return cur[0], cur[1]
+
+
+@contextmanager
+def track_node(node_name: str) -> Iterator[dict]:
+    """Bọc 1 lần chạy node, yield dict số liệu của lần chạy đó."""
+    m = new_metrics()
+    token = _current.set((node_name, m))
+    start = time.perf_counter()
+    try:
+        yield m
+    finally:
+        _current.reset(token)
+        m["wall_time"] = round(time.perf_counter() - start, 3)
+        with _lock:
+            _node_seconds[node_name] += m["wall_time"]
+            _node_count[node_name] += 1
+
+
+def record_node_status(node_name: str, status: str):
+    with _lock:
+        _node_runs[(node_name, status)] += 1
+
+
+def record_llm(provider: str, model: str, tokens_in: int = 0, tokens_out: int = 0):
+    node, m = _node_label()
+    with _lock:
+        _llm_calls[(node, provider, model)] += 1
+        _llm_tokens[(node, provider, model, "in")] += int(tokens_in or 0)
+        _llm_tokens[(node, provider, model, "out")] += int(tokens_out or 0)
+        if m is not None:
+            m["llm_calls"] += 1
+            m["llm_tokens_in"] += int(tokens_in or 0)
+            m["llm_tokens_out"] += int(tokens_out or 0)
+
+
+def record_http(host: str, nbytes: int = 0):
+    node, m = _node_label()
+    with _lock:
+        _http_calls[(node, host)] += 1
+        _http_bytes[(node, host)] += int(nbytes or 0)
+        if m is not None:
+            m["http_calls"] += 1
+            m["http_bytes"] += int(nbytes or 0)
+
+
+def record_retry(kind: str, node_name: Optional[str] = None):
+    """kind: 'llm' | 'node' ...; node_name=None → lấy node đang chạy."""
+    node, m = (node_name, None) if node_name else _node_label()
+    with _lock:
+        _retries[(node, kind)] += 1
+        if m is not None:
+            m["retries"] += 1
+
+
+def merge_metrics(total: Optional[dict], part: dict) -> dict:
+    total = dict(total or new_metrics())
+    for k in METRIC_FIELDS:
+        total[k] = round(total.get(k, 0) + part.get(k, 0), 3)
+    return total
+
+
+# ---------------- httpx hooks ----------------
+def http_event_hooks() -> dict:
+    """event_hooks cho httpx.Client: đếm call + bytes theo node."""
+    def on_response(response):
+        response.read()
+        record_http(response.request.url.host, len(response.content))
+    return {"response": [on_response]}
+
+
+def ahttp_event_hooks() -> dict:
+    """event_hooks cho httpx.AsyncClient."""
+    async def on_response(response):
+        await response.aread()
+        record_http(response.request.url.host, len(response.content))
+    return {"response": [on_response]}
+
+
+# ---------------- Báo cáo ----------------
+def format_summary(per_node: Dict[str, dict]) -> str:
+    """Bảng tóm tắt 1 run (dùng trong finalize_node)."""
+    if not per_node:
+        return "(không có số liệu node)"
+    lines = ["node | time(s) | llm calls | tokens in/out | http calls | http KB | retries"]
+    total = new_metrics()
+    for node, m in per_node.items():
+        total = merge_metrics(total, m)
+        lines.append(
+            f"{node} | {m.get('wall_time', 0):.2f} | {m.get('llm_calls', 0)} | "
+            f"{m.get('llm_tokens_in', 0)}/{m.get('llm_tokens_out', 0)} | {m.get('http_calls', 0)} | "
+            f"{m.get('http_bytes', 0) / 1024:.1f} | {m.get('retries', 0)}"
+        )
+    lines.append(
+        f"TOTAL | {total['wall_time']:.2f} | {total['llm_calls']} | "
+        f"{total['llm_tokens_in']}/{total['llm_tokens_out']} | {total['http_calls']} | "
+        f"{total['http_bytes'] / 1024:.1f} | {total['retries']}"
+    )
+    return "\n".join(lines)
+
+
+def _esc(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus() -> str:
+    """Text exposition format của Prometheus (không cần thư viện prometheus_client)."""
+    with _lock:
+        node_runs = dict(_node_runs)
+        node_seconds = dict(_node_seconds)
+        node_count = dict(_node_count)
+        llm_calls = dict(_llm_calls)
+        llm_tokens = dict(_llm_tokens)
+        http_calls = dict(_http_calls)
+        http_bytes = dict(_http_bytes)
+        retries = dict(_retries)
+
+    out = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            out.append(f"{name}{_labels(**labels)} {value}")
+
+    metric("workflow_node_runs_total", "counter", "Số lần node kết thúc theo trạng thái",
+           [({"node": n, "status": s}, v) for (n, s), v in node_runs.items()])
+    out.append("# HELP workflow_node_duration_seconds Thời gian chạy node")
+    out.append("# TYPE workflow_node_duration_seconds summary")
+    for node, total in node_seconds.items():
+        out.append(f"workflow_node_duration_seconds_sum{_labels(node=node)} {total:.3f}")
+        out.append(f"workflow_node_duration_seconds_count{_labels(node=node)} {node_count.get(node, 0)}")
+    metric("workflow_llm_calls_total", "counter", "Số request LLM",
+           [({"node": n, "provider": p, "model": mo}, v) for (n, p, mo), v in llm_calls.items()])
+    metric("workflow_llm_tokens_total", "counter", "Token LLM (in = prompt, out = completion)",
+           [({"node": n, "provider": p, "model": mo, "direction": d}, v) for (n, p, mo, d), v in llm_tokens.items()])
+    metric("workflow_http_requests_total", "counter", "Số request HTTP ra ngoài",
+           [({"node": n, "host": h}, v) for (n, h), v in http_calls.items()])
+    metric("workflow_http_response_bytes_total", "counter", "Tổng bytes response HTTP",
+           [({"node": n, "host": h}, v) for (n, h), v in http_bytes.items()])
+    metric("workflow_retries_total", "counter", "Số lần retry",
+           [({"node": n, "kind": k}, v) for (n, k), v in retries.items()])
+    return "\n".join(out) + "\n"
@@ -1,8 +1,13 @@
 import os
+import json
+import asyncio
+import threading
 from dotenv import load_dotenv
 import httpx
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Iterator, List, Optional
+
+from services.metrics import ahttp_event_hooks, http_event_hooks
 
 # Load biến môi trường từ .env
 load_dotenv()
@@ -19,28 +24,178 @@ HEADERS = {
     "Authorization": f"Bearer {NOTION_TOKEN}",
     "Content-Type": "application/json",
 }
+NOTION_VERSION = "2025-09-03"
+
+# File lưu page id theo data source + tên (JSON, ghi atomic)
+NOTION_PAGE_CACHE = os.getenv("NOTION_PAGE_CACHE", ".cache/notion_pages.json")
+
+# Thuộc tính title của từng data source (dùng khi warm cache)
+TITLE_PROPERTY = {
+    SOURCE_ID_PROJECT: "Name",
+    SOURCE_ID_BLOG: "Name",
+    SOURCE_ID_HEXAGRAM: "Date",
+}
+
+# Gom các update status liên tiếp của cùng 1 page trong khoảng này thành 1 PATCH
+NOTION_COALESCE_WINDOW = float(os.getenv("NOTION_COALESCE_WINDOW", "0.3"))
+
+def _task_create_payload(task_name: str, start=None, deadline=None) -> dict:
+    start = start or datetime.today().isoformat()
+    deadline = deadline or datetime.today().isoformat()
+    return {
+        "parent": {"type": "data_source_id", "data_source_id": SOURCE_ID_PROJECT},
+        "properties": {
+            "Name": {"title": [{"text": {"content": task_name}}]},
+            "Start": {"date": {"start": start}},
+            "Deadline": {"date": {"start": deadline}},
+        }
+    }
+
+
+def _title_filter(source_id: str, name: str) -> dict:
+    prop = TITLE_PROPERTY.get(source_id, "Name")
+    return {"filter": {"property": prop, "title": {"equals": name}}, "page_size": 1}
+
+
+def _page_title(page: dict, prop: str) -> str:
+    title_list = page.get("properties", {}).get(prop, {}).get("title", [])
+    return "".join(t.get("plain_text") or t.get("text", {}).get("content", "") for t in title_list)
+
+
+class PageIdIndex:
+    """
+    Index page id lưu trên đĩa: {data_source_id: {name: page_id}}.
+    Dùng chung 1 instance cho mỗi file (xem get_page_index) để các NotionService
+    trong cùng process không ghi đè dữ liệu của nhau.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.warmed: set = set()
+        self._lock = threading.RLock()
+        self.data: Dict[str, Dict[str, str]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def bucket(self, source_id: str) -> Dict[str, str]:
+        with self._lock:
+            return self.data.setdefault(source_id, {})
+
+    def set(self, source_id: str, name: str, page_id: str):
+        with self._lock:
+            self.bucket(source_id)[name] = page_id
+            self.save()
+
+    def forget(self, source_id: str, name: str):
+        with self._lock:
+            if self.bucket(source_id).pop(name, None) is not None:
+                self.save()
+
+    def update(self, source_id: str, mapping: Dict[str, str]):
+        with self._lock:
+            self.bucket(source_id).update(mapping)
+            self.save()
+
+    def save(self):
+        with self._lock:
+            try:
+                folder = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(folder, exist_ok=True)
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print("⚠️ Không ghi được Notion page cache:", e)
+
+
+_page_indexes: Dict[str, PageIdIndex] = {}
+_page_indexes_lock = threading.Lock()
+
+
+def get_page_index(path: str = NOTION_PAGE_CACHE) -> PageIdIndex:
+    with _page_indexes_lock:
+        key = os.path.abspath(path)
+        if key not in _page_indexes:
+            _page_indexes[key] = PageIdIndex(path)
+        return _page_indexes[key]
 
 
 class NotionService:
-    def __init__(self):
-        self.task_ids = {}
-        self.task_blogs: Dict[str, Dict] = {} 
-        self.task_hexagram: Dict[str, Dict] = {} 
-        self.client = httpx.Client(timeout=120)
+    def __init__(self, page_cache: str = NOTION_PAGE_CACHE):
+        self.page_index = get_page_index(page_cache)
+        # 3 map này là view trực tiếp vào page_index
+        self.task_ids: Dict[str, str] = self.page_index.bucket(SOURCE_ID_PROJECT)
+        self.task_blogs: Dict[str, str] = self.page_index.bucket(SOURCE_ID_BLOG)
+        self.task_hexagram: Dict[str, str] = self.page_index.bucket(SOURCE_ID_HEXAGRAM)
+        self.client = httpx.Client(timeout=120, event_hooks=http_event_hooks())
+
+    # ---------------- page id cache ----------------
+    def _query_all(self, url: str, notion_version: str, payload: Optional[dict] = None) -> Iterator[dict]:
+        """Query có phân trang, yield từng page. Raise nếu Notion trả lỗi."""
+        body = {**(payload or {}), "page_size": 100}
+        while True:
+            res = self.client.post(url, headers={**HEADERS, "Notion-Version": notion_version}, json=body)
+            if res.status_code != 200:
+                raise RuntimeError(res.text)
+            data = res.json()
+            yield from data.get("results", [])
+            if not data.get("has_more") or not data.get("next_cursor"):
+                return
+            body["start_cursor"] = data["next_cursor"]
+
+    def warm(self, source_id: Optional[str] = None):
+        """
+        Nạp name -> page_id của data source vào page_index bằng 1 query phân trang.
+        Mỗi data source chỉ warm 1 lần mỗi process.
+        """
+        source_ids = [source_id] if source_id else list(TITLE_PROPERTY)
+        for sid in source_ids:
+            if sid in self.page_index.warmed:
+                continue
+            prop = TITLE_PROPERTY.get(sid, "Name")
+            mapping = {}
+            try:
+                url = f"https://api.notion.com/v1/data_sources/{sid}/query"
+                for page in self._query_all(url, NOTION_VERSION):
+                    name = _page_title(page, prop)
+                    if name:
+                        mapping.setdefault(name, page["id"])
+            except Exception as e:
+                print("⚠️ Lỗi warm Notion page cache:", e)
+                continue
+            self.page_index.update(sid, mapping)
+            self.page_index.warmed.add(sid)
+            print(f"📌 Warm {len(mapping)} page từ data source {sid}")
+
+    def _lookup(self, source_id: str, name: str) -> Optional[str]:
+        """
+        Page id từ page_index; không có (warm chưa xong hoặc page mới tạo ở nơi khác)
+        thì hỏi Notion trực tiếp bằng 1 query lọc theo title.
+        """
+        bucket = self.page_index.bucket(source_id)
+        if name in bucket:
+            return bucket[name]
+        url = f"https://api.notion.com/v1/data_sources/{source_id}/query"
+        res = self.client.post(
+            url, headers={**HEADERS, "Notion-Version": NOTION_VERSION}, json=_title_filter(source_id, name)
+        )
+        results = res.json().get("results", []) if res.status_code == 200 else []
+        if not results:
+            return None
+        page_id = results[0]["id"]
+        self.page_index.set(source_id, name, page_id)
+        return page_id
 
     def create_task(self, task_name: str, start=None, deadline=None):
-    
-        start = start or datetime.today().isoformat()
-        deadline = deadline or datetime.today().isoformat()
 
-        data = {
-            "parent": {"type": "data_source_id", "data_source_id": SOURCE_ID_PROJECT},
-            "properties": {
-                "Name": {"title": [{"text": {"content": task_name}}]},
-                "Start": {"date": {"start": start}},
-                "Deadline": {"date": {"start": deadline}},
-            }
-        }
+        data = _task_create_payload(task_name, start, deadline)
 
         res = self.client.post(
             NOTION_API_URL,
@@ -50,7 +205,7 @@ class NotionService:
 
         if res.status_code in [200, 201]:
             page_id = res.json()["id"]
-            self.task_ids[task_name] = page_id
+            self.page_index.set(SOURCE_ID_PROJECT, task_name, page_id)
             print(f"📌 Tạo task '{task_name}' trên Notion")
         else:
             print("⚠️ Lỗi tạo task:", res.text)
@@ -58,13 +213,13 @@ class NotionService:
 
     def update_task(self, task_name: str, properties: dict):
 
-        if task_name not in self.task_ids:
+        if not self._lookup(SOURCE_ID_PROJECT, task_name):
              self.create_task(task_name)
 
         page_id = self.task_ids.get(task_name)
         if not page_id:
             print(f"⚠️ Không tìm thấy blog '{task_name}' để cập nhật")
-            return
+            return False
         
         res = self.client.patch(
             f"{NOTION_API_URL}/{page_id}",
@@ -73,8 +228,12 @@ class NotionService:
         )
         if res.status_code in [200, 201]:
             print(f"✅ Update task '{task_name}'")
-        else:
-            print("⚠️ Lỗi update task:", res.text)
+            return True
+        if res.status_code == 404:
+            # page đã bị xoá trên Notion → lần sau tạo lại
+            self.page_index.forget(SOURCE_ID_PROJECT, task_name)
+        print("⚠️ Lỗi update task:", res.text)
+        return False
 
     def finalize_task(self, name: str):
         self.update_task(name, {"KPI": {"number": 100}})
@@ -82,20 +241,15 @@ class NotionService:
 
     def get_relation_mapping(self, database_id):
         url = f"https://api.notion.com/v1/databases/{database_id}/query"
-        res = self.client.post(
-                url,
-                headers={**HEADERS, "Notion-Version": "2022-06-28"},
-            )
-        if res.status_code != 200:
-            print("⚠️ Lỗi query database:", res.text)
-            return {}
         mapping = {}
-        for page in res.json().get("results", []):
-            page_id = page["id"]
-            title_list = page["properties"].get("Name", {}).get("title", [])
-            if title_list:
-                name = title_list[0]["text"]["content"]
-                mapping[name] = page_id
+        try:
+            for page in self._query_all(url, "2022-06-28"):
+                name = _page_title(page, "Name")
+                if name:
+                    mapping[name] = page["id"]
+        except Exception as e:
+            print("⚠️ Lỗi query database:", e)
+            return {}
         return mapping
 
     def create_blog(self, task_name: str):
@@ -112,13 +266,13 @@ class NotionService:
             
         if res.status_code in [200, 201]:
             page_id = res.json()["id"]
-            self.task_blogs[task_name] = page_id
+            self.page_index.set(SOURCE_ID_BLOG, task_name, page_id)
             print(f"📌 Tạo blog '{task_name}' trên Notion")
         else:
             print("⚠️ Lỗi tạo blog:", res.text)
 
     def update_blog(self, task_name: str, properties: dict):
-        if task_name not in self.task_blogs:
+        if not self._lookup(SOURCE_ID_BLOG, task_name):
              self.create_blog(task_name)
              
         # if not blogId:
@@ -135,6 +289,8 @@ class NotionService:
         if res.status_code in [200, 201]:
             print(f"✅ Update task '{task_name}'")
         else:
+            if res.status_code == 404:
+                self.page_index.forget(SOURCE_ID_BLOG, task_name)
             print("⚠️ Lỗi update task:", res.text)
 
 
@@ -152,13 +308,13 @@ class NotionService:
             
         if res.status_code in [200, 201]:
             page_id = res.json()["id"]
-            self.task_hexagram[task_name] = page_id
+            self.page_index.set(SOURCE_ID_HEXAGRAM, task_name, page_id)
             print(f"📌 Tạo blog '{task_name}' trên Notion")
         else:
             print("⚠️ Lỗi tạo blog:", res.text)
 
     def update_hexagram(self, task_name: str, properties: dict):
-        if task_name not in self.task_hexagram:
+        if not self._lookup(SOURCE_ID_HEXAGRAM, task_name):
              self.create_hexagram(task_name)
              
         # if not blogId:
@@ -175,6 +331,8 @@ class NotionService:
         if res.status_code in [200, 201]:
             print(f"✅ Update task '{task_name}'")
         else:
+            if res.status_code == 404:
+                self.page_index.forget(SOURCE_ID_HEXAGRAM, task_name)
             print("⚠️ Lỗi update task:", res.text)
     
     def get_blog(self, name: str):
@@ -226,3 +384,162 @@ class NotionService:
 
     async def aclose(self):
         await self.client.aclose()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+
+class AsyncNotionService:
+    """
+    Bản async của NotionService cho task status.
+    - 1 httpx.AsyncClient cho mỗi instance (pool + keep-alive, HTTP/2 nếu có h2), gắn với
+      event loop tạo ra nó; đổi loop thì client cũ được đóng trên loop cũ.
+    - update_task gom các update liên tiếp cho cùng task trong NOTION_COALESCE_WINDOW
+      thành 1 PATCH (properties sau ghi đè properties trước).
+    - update_task: awaitable, trả về True/False.
+    - update_task_nowait: fire-and-forget, trả về asyncio.Task.
+    - aclose() chờ gửi hết rồi đóng client.
+    """
+
+    def __init__(self, coalesce_window: float = NOTION_COALESCE_WINDOW, page_cache: str = NOTION_PAGE_CACHE):
+        self.coalesce_window = coalesce_window
+        self.page_index = get_page_index(page_cache)
+        self.task_ids: Dict[str, str] = self.page_index.bucket(SOURCE_ID_PROJECT)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[str, dict] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self._inflight: set = set()
+        self._create_locks: Dict[str, asyncio.Lock] = {}
+        self._send_locks: Dict[str, asyncio.Lock] = {}
+
+    def get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is not None and not self._client.is_closed and self._client_loop is loop:
+            return self._client
+
+        old, old_loop = self._client, self._client_loop
+        if old is not None and not old.is_closed and old_loop is not None:
+            # Client async chỉ đóng được trên loop của nó; loop đã dừng thì connection bị bỏ theo loop
+            if old_loop.is_running():
+                asyncio.run_coroutine_threadsafe(old.aclose(), old_loop)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30, connect=10),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+            http2=_http2_available(),
+            headers={**HEADERS, "Notion-Version": NOTION_VERSION},
+            event_hooks=ahttp_event_hooks(),
+        )
+        self._client_loop = loop
+        return self._client
+
+    async def _lookup(self, task_name: str) -> Optional[str]:
+        """Page id từ page_index; không có thì hỏi Notion trực tiếp (1 query lọc theo title)."""
+        page_id = self.task_ids.get(task_name)
+        if page_id:
+            return page_id
+        url = f"https://api.notion.com/v1/data_sources/{SOURCE_ID_PROJECT}/query"
+        try:
+            res = await self.get_client().post(url, json=_title_filter(SOURCE_ID_PROJECT, task_name))
+        except httpx.HTTPError as e:
+            print("⚠️ Lỗi tìm task trên Notion:", e)
+            return None
+        results = res.json().get("results", []) if res.status_code == 200 else []
+        if not results:
+            return None
+        page_id = results[0]["id"]
+        self.page_index.set(SOURCE_ID_PROJECT, task_name, page_id)
+        return page_id
+
+    async def create_task(self, task_name: str, start=None, deadline=None) -> Optional[str]:
+        lock = self._create_locks.setdefault(task_name, asyncio.Lock())
+        async with lock:
+            # task khác có thể đã tạo page trong lúc chờ lock, hoặc page có trên Notion mà chưa có trong cache
+            page_id = await self._lookup(task_name)
+            if page_id:
+                return page_id
+
+            res = await self.get_client().post(NOTION_API_URL, json=_task_create_payload(task_name, start, deadline))
+            if res.status_code in [200, 201]:
+                page_id = res.json()["id"]
+                self.page_index.set(SOURCE_ID_PROJECT, task_name, page_id)
+                print(f"📌 Tạo task '{task_name}' trên Notion")
+                return page_id
+            print("⚠️ Lỗi tạo task:", res.text)
+            return None
+
+    async def update_task(self, task_name: str, properties: dict) -> bool:
+        loop = asyncio.get_running_loop()
+        self._pending[task_name] = {**self._pending.get(task_name, {}), **properties}
+        waiter = loop.create_future()
+        self._waiters.setdefault(task_name, []).append(waiter)
+
+        if task_name not in self._flushers:
+            task = asyncio.create_task(self._flush_later(task_name))
+            self._flushers[task_name] = task
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+        return await waiter
+
+    def update_task_nowait(self, task_name: str, properties: dict) -> asyncio.Task:
+        task = asyncio.create_task(self.update_task(task_name, properties))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return task
+
+    async def flush(self):
+        """Chờ mọi PATCH đang gom/đang gửi hoàn tất (gọi khi shutdown)."""
+        while self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+
+    async def _flush_later(self, task_name: str):
+        ok = False
+        waiters: List[asyncio.Future] = []
+        try:
+            await asyncio.sleep(self.coalesce_window)
+            # Từ đây update mới của task sẽ mở 1 đợt gom mới
+            self._flushers.pop(task_name, None)
+            properties = self._pending.pop(task_name, {})
+            waiters = self._waiters.pop(task_name, [])
+            # Giữ thứ tự PATCH cho cùng 1 task
+            async with self._send_locks.setdefault(task_name, asyncio.Lock()):
+                ok = await self._patch(task_name, properties)
+        except Exception as e:
+            print("⚠️ Lỗi update task:", e)
+        finally:
+            if self._flushers.get(task_name) is asyncio.current_task():
+                # bị huỷ khi đang gom → bỏ đợt này
+                self._flushers.pop(task_name, None)
+                self._pending.pop(task_name, None)
+                waiters = self._waiters.pop(task_name, [])
+            for w in waiters:
+                if not w.done():
+                    w.set_result(ok)
+
+    async def _patch(self, task_name: str, properties: dict) -> bool:
+        page_id = self.task_ids.get(task_name) or await self.create_task(task_name)
+        if not page_id:
+            print(f"⚠️ Không tìm thấy task '{task_name}' để cập nhật")
+            return False
+
+        res = await self.get_client().patch(f"{NOTION_API_URL}/{page_id}", json={"properties": properties})
+        if res.status_code in [200, 201]:
+            print(f"✅ Update task '{task_name}'")
+            return True
+        if res.status_code == 404:
+            # page đã bị xoá trên Notion → lần sau tạo lại
+            self.page_index.forget(SOURCE_ID_PROJECT, task_name)
+        print("⚠️ Lỗi update task:", res.text)
+        return False
+
+    async def aclose(self):
+        await self.flush()
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
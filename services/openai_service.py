@@ -1,20 +1,11 @@
-import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI  # import OpenAI LLM
+from services.llm_gateway import chat_model
 
-load_dotenv()
+# Model OpenAI qua gateway (gpt-4o-mini giá rẻ, có thể đổi thành gpt-4o).
+# Không gọi thử lúc import nữa — client chỉ tạo khi invoke lần đầu.
+llm = chat_model("openai", "gpt-4o-mini", 0.7)
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("❌ Thiếu OPENAI_API_KEY trong .env")
 
-# Khởi tạo model OpenAI
-llm = ChatOpenAI(
-    model="gpt-4o-mini",   # model free/giá rẻ, bạn có thể đổi thành gpt-4o
-    api_key=api_key,
-    temperature=0.7
-)
-
-# Test gọi LLM
-resp = llm.invoke("Xin chào, bạn có khỏe không?")
-print(resp.content)
+if __name__ == "__main__":
+    # Test gọi LLM
+    resp = llm.invoke("Xin chào, bạn có khỏe không?")
+    print(resp.content)
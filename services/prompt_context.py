@@ -0,0 +1,178 @@
+# services/prompt_context.py
+"""
+Dựng phần context (state) nhúng vào prompt:
+- Mỗi node khai báo field cần dùng (PROMPT_FIELDS) → chỉ chiếu các field đó, không dump cả state.
+  PROMPT_FIELDS cũng là khai báo "reads" của node cho DAG runner (brain/nodes.node_io), nên
+  module này phải import nhẹ (tiktoken chỉ load khi cần đếm token).
+- Cắt theo ngân sách token của từng node (ước lượng bằng tiktoken nếu có, không thì theo số ký tự).
+- Ghi lại kích thước prompt theo node (prompt_stats) để theo dõi.
+"""
+import os
+import json
+import functools
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+CHARS_PER_TOKEN = 3.0  # tiếng Việt có dấu ~3 ký tự / token
+MIN_LEAF_CHARS = 40    # không cắt string ngắn hơn mức này
+DEFAULT_PROMPT_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+
+DAILY_EXPERT_KEYS = ("health", "finance", "psychology", "work", "trend", "family", "spiritual", "community")
+
+# Field (dotted path) mà từng node thực sự cần từ state.
+# outputs.<node> là key runner ghi kết quả của node đó (vd idea_node → outputs.idea).
+PROMPT_FIELDS: Dict[str, tuple] = {
+    "data_analysis": ("topic",),
+    "research": ("topic", "outputs.keyword"),
+    "title": ("topic", "outputs.keyword", "outputs.idea"),
+    "content": (
+        "daily.thien", "daily.dia", "daily.nhan", "daily.key_event",
+        "daily.input", "daily.llm_summary", "daily.llm_key_event_effect",
+        "daily.base.name", "daily.transformed.name",
+    ) + tuple(f"daily.{k}" for k in DAILY_EXPERT_KEYS),
+}
+
+# Ngân sách token cho phần dữ liệu của từng node (không tính phần hướng dẫn cố định)
+PROMPT_BUDGETS: Dict[str, int] = {
+    "data_analysis": int(os.getenv("PROMPT_BUDGET_DATA_ANALYSIS", "3000")),
+    "research": int(os.getenv("PROMPT_BUDGET_RESEARCH", "500")),
+    "research_doc": int(os.getenv("PROMPT_BUDGET_RESEARCH_DOC", "4000")),  # nội dung trang web tham khảo
+    "title": int(os.getenv("PROMPT_BUDGET_TITLE", "800")),
+    "content": int(os.getenv("PROMPT_BUDGET_CONTENT", "2000")),
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # tiktoken không bắt buộc
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def to_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(_plain(value), ensure_ascii=False, default=str)
+
+
+def _plain(value: Any) -> Any:
+    """Pydantic model → dict, đệ quy cho dict/list."""
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _get(value: Any, parts: list) -> Any:
+    for i, part in enumerate(parts):
+        if isinstance(value, list):
+            return [_get(v, parts[i:]) for v in value]
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _put(target: dict, parts: list, value: Any):
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    target[parts[-1]] = value
+
+
+def project(state: Dict[str, Any], paths: Iterable[str]) -> Dict[str, Any]:
+    """Chỉ giữ các field trong paths (dotted), bỏ qua field thiếu/None."""
+    source = _plain(state)
+    out: Dict[str, Any] = {}
+    for path in paths:
+        parts = path.split(".")
+        value = _get(source, parts)
+        if value is not None:
+            _put(out, parts, value)
+    return out
+
+
+def _longest_leaf(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return max((_longest_leaf(v) for v in value.values()), default=0)
+    if isinstance(value, list):
+        return max((_longest_leaf(v) for v in value), default=0)
+    return 0
+
+
+def _truncate(value: Any, limit: int) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= limit else value[:limit] + "…"
+    if isinstance(value, dict):
+        return {k: _truncate(v, limit) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_truncate(v, limit) for v in value]
+    return value
+
+
+def fit_text(text: str, budget: int) -> str:
+    """Cắt cứng 1 đoạn text cho vừa budget token."""
+    if estimate_tokens(text) <= budget:
+        return text
+    cut = int(budget * CHARS_PER_TOKEN)
+    while cut > 0 and estimate_tokens(text[:cut]) > budget:
+        cut = int(cut * 0.9)
+    return text[:cut] + "…"
+
+
+def fit(value: Any, budget: int) -> str:
+    """
+    Serialize value và ép vừa budget token: cắt dần các string dài nhất
+    (giữ nguyên cấu trúc JSON), cuối cùng mới cắt cứng text.
+    """
+    value = _plain(value)
+    text = to_text(value)
+    if estimate_tokens(text) <= budget:
+        return text
+    limit = _longest_leaf(value)
+    while limit > MIN_LEAF_CHARS:
+        limit = max(MIN_LEAF_CHARS, int(limit * 0.7))
+        text = to_text(_truncate(value, limit))
+        if estimate_tokens(text) <= budget:
+            return text
+    return fit_text(text, budget)
+
+
+def build_context(node: str, state: Dict[str, Any], budget: Optional[int] = None) -> str:
+    """Context JSON gọn cho node: chiếu field theo PROMPT_FIELDS rồi cắt theo budget."""
+    paths = PROMPT_FIELDS.get(node)
+    data = project(state, paths) if paths is not None else {k: v for k, v in state.items() if k != "messages"}
+    return fit(data, budget or PROMPT_BUDGETS.get(node, DEFAULT_PROMPT_BUDGET))
+
+
+# ---------------- Báo cáo kích thước prompt ----------------
+prompt_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def report_prompt(node: str, prompt: str) -> int:
+    """Ghi lại kích thước prompt của node, trả về số token ước lượng."""
+    tokens = estimate_tokens(prompt)
+    with _stats_lock:
+        s = prompt_stats.setdefault(node, {"calls": 0, "tokens": 0, "chars": 0, "max_tokens": 0})
+        s["calls"] += 1
+        s["tokens"] += tokens
+        s["chars"] += len(prompt)
+        s["max_tokens"] = max(s["max_tokens"], tokens)
+    print(f"📏 {node} prompt: ~{tokens} tokens ({len(prompt)} ký tự)")
+    return tokens
@@ -0,0 +1,90 @@
+# services/registry.py
+"""
+Registry service lazy: client/model nặng (Notion, TinyML, hexagram...) chỉ được
+import + khởi tạo ở lần dùng đầu tiên, không phải lúc import module.
+- registry.register("tên", "module:attr") → attr là class/hàm factory, gọi không tham số.
+- lazy("tên") → proxy, truy cập attribute/gọi hàm mới tạo object thật.
+"""
+import importlib
+import threading
+from typing import Any, Callable, Dict, Union
+
+
+def import_string(path: str) -> Any:
+    """'package.module:attr' → attr (import module khi gọi)."""
+    module_name, _, attr = path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attr) if attr else module
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Union[str, Callable[[], Any]]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Union[str, Callable[[], Any]]):
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                factory = self._factories[name]
+                if isinstance(factory, str):
+                    factory = import_string(factory)
+                self._instances[name] = factory()
+                print(f"🔌 Khởi tạo service '{name}'")
+            return self._instances[name]
+
+    def loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: str = None):
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+
+class LazyService:
+    """Proxy tới service trong registry, tạo ở lần truy cập đầu tiên."""
+
+    def __init__(self, name: str, reg: ServiceRegistry):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_registry", reg)
+
+    def _target(self) -> Any:
+        return self._registry.get(self._name)
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._target(), item)
+
+    def __setattr__(self, key: str, value: Any):
+        setattr(self._target(), key, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._target()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._registry.loaded(self._name) else "lazy"
+        return f"<LazyService {self._name} ({state})>"
+
+
+registry = ServiceRegistry()
+
+
+def lazy(name: str) -> LazyService:
+    return LazyService(name, registry)
+
+
+# Service dùng chung (khai báo bằng đường dẫn import để không kéo module vào lúc khởi động)
+registry.register("notion", "services.notion_service:NotionService")
+registry.register("notion_async", "services.notion_service:AsyncNotionService")
+registry.register("tiny_ml", "brain.tiny_ml:TinyML")
+registry.register("policy", "brain.policy:PolicyEngine")
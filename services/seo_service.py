@@ -1,4 +1,5 @@
 import requests
+import httpx
 from pytrends.request import TrendReq
 import os
 from dotenv import load_dotenv
@@ -39,6 +40,18 @@ class SEOContentPipeline:
         res = requests.get("https://serpapi.com/search", params=params).json()
         return [r["title"] for r in res.get("organic_results", [])[:8]]
 
+    async def afetch_competitor_titles(self, keyword: str, client: httpx.AsyncClient, location: str = "Vietnam"):
+        """Bản async của fetch_competitor_titles, dùng chung AsyncClient của caller."""
+        params = {
+            "engine": "google",
+            "q": keyword,
+            "location": location,
+            "api_key": self.serpapi_key,
+        }
+        res = await client.get("https://serpapi.com/search", params=params)
+        res.raise_for_status()
+        return [r["title"] for r in res.json().get("organic_results", [])[:8]]
+
     def run(self, seed_keyword: str):
         """Pipeline đơn giản: Keyword → Competitors."""
         # seo_keywords = self.fetch_keywords(seed_keyword)